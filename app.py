@@ -1,47 +1,68 @@
-import threading
-from flask import Flask, jsonify, request, render_template
+from flask import Flask, Blueprint, jsonify, request, render_template
 import os
 import requests
 from flask_cors import CORS
 from dotenv import load_dotenv 
-from pymongo import MongoClient
 from bson.objectid import ObjectId
 import logging
 import gc   
 
+# Load .env before the project modules, which read their flags at import time
+load_dotenv()
 
-from src.speech_to_text import speech_to_text
-from src.facial_emotion import facial_emotion
-from src.speech_emotion1 import speechEmotionRecognition
-from src.compare import compare
+from utils.model_server import MODEL_SERVER_SOCKET
+from utils.model_registry import registry
+
+# With a model server the analyzers are thin adapters and this process loads no models
+if MODEL_SERVER_SOCKET:
+    from utils.model_client import speech_to_text, facial_emotion, predict_speech_emotions, compare, precompute_answer_embeddings, server_stats
+    answer_cache = None
+    SER_MODEL_PATH = None
+else:
+    from src.speech_to_text import speech_to_text
+    from src.facial_emotion import facial_emotion
+    from src.speech_emotion1 import predict_speech_emotions, SER_MODEL_PATH
+    from src.compare import compare, answer_cache, precompute_answer_embeddings
+from utils.executor import executor, QueueFullError
+from utils.inference_broker import broker
 
 # from utils.database.pre_defined_questions import retrive_preDefinedQA
 # from utils.database.candidates import *
-from utils.extract_audio import extract_audio
+from utils.extract_audio import decode_audio
+from utils.media_decode import decode_media
+from utils.vad import VAD_ENABLED, detect_speech
+from utils.tiers import DEFAULT_TIER, resolve_tier, tier_settings
+from utils.database.connection import mongo
+from utils.process_pool import stage_pools
+from utils.cpu_budget import CPU_BUDGET_ENABLED, install as install_cpu_budget, plan_budget
+from utils.job_queue import JOB_QUEUE_ENABLED, JobQueue, JobWorker
+from utils.dag import Pipeline, Stage, SkipStage
 # from utils.s3_storage import upload_to_s3, download_file_from_s3
 
-load_dotenv()
 flask_env = os.getenv('FLASK_ENV', 'development')  # Default to 'development' if not set
 os.environ['FLASK_ENV'] = flask_env
 mongo_uri = os.getenv("MONGO_URI")
 mongo_db_name = os.getenv("MONGO_DB_NAME")
 
-client = MongoClient(mongo_uri)
-db = client[mongo_db_name]
-interviews_collection = db["interviews"]
-questions_collection = db['questions']
+# Collections connect on first use in each process, so the module can be imported before a fork
+mongo.configure(mongo_uri, mongo_db_name)
+interviews_collection = mongo.collection("interviews")
+questions_collection = mongo.collection("questions")
+if answer_cache is not None:
+    answer_cache.attach(questions_collection)
+job_queue = JobQueue(mongo.collection("jobs"))
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-app = Flask(__name__)
-CORS(app)
+api = Blueprint("api", __name__)
 
 UPLOAD_FOLDER = 'recorded_video'
 AUDIO_FOLDER = 'recorded_audio'
-if not os.path.exists(UPLOAD_FOLDER):
-    os.makedirs(UPLOAD_FOLDER)
-if not os.path.exists(AUDIO_FOLDER):
-    os.makedirs(AUDIO_FOLDER)
+
+# Decode frames and audio in a single ffmpeg pass instead of OpenCV + a separate audio pass
+MEDIA_DEMUX = os.getenv("MEDIA_DEMUX", "false").lower() == "true"
+# Load every analyzer model at startup instead of on the first job (gunicorn.conf.py loads them itself)
+PRELOAD_MODELS = os.getenv("PRELOAD_MODELS", "false").lower() == "true"
     
 def get_question_details(questionId):
     """Fetch question details by questionId."""
@@ -70,8 +91,8 @@ def download_video(video_url, save_path):
     except Exception as e:
         return {"error": f"Failed to download video: {str(e)}"}
     
-def update_stage(interviewId, questionId, field, stage, data=None):
-    """Update the stage and optional data for a specific field in the database."""
+def update_stage(interviewId, questionId, field, stage, data=None, tier=None, started_at=None, finished_at=None, error=None):
+    """Update the stage, optional data, the model tier that produced it, its timestamps and error for a specific field in the database."""
     filter_query = {
         "_id": ObjectId(interviewId),
         "responses.questionId": ObjectId(questionId)
@@ -80,6 +101,14 @@ def update_stage(interviewId, questionId, field, stage, data=None):
     update_fields = {f"responses.$.{field}.stage": stage}
     if data is not None:
         update_fields[f"responses.$.{field}.data"] = data
+    if tier is not None:
+        update_fields[f"responses.$.{field}.tier"] = tier
+    if started_at is not None:
+        update_fields[f"responses.$.{field}.startedAt"] = started_at
+    if finished_at is not None:
+        update_fields[f"responses.$.{field}.finishedAt"] = finished_at
+    if error is not None:
+        update_fields[f"responses.$.{field}.error"] = error
 
     result = interviews_collection.update_one(filter_query, {"$set": update_fields})
     
@@ -91,211 +120,209 @@ def update_stage(interviewId, questionId, field, stage, data=None):
     return result
 
 
-def process_video(file_path, interviewId, questionId):
-    """Background task for processing video."""
-    try:
-        print("Processing video:", file_path)
-
-        # Extract audio from the video
-        audio_file = extract_audio(file_path)
-        if isinstance(audio_file, dict) and "error" in audio_file:
-            print("Error in audio extraction:", audio_file["error"])
-            raise Exception(audio_file["error"])
-
-        # Ensure audio file exists before proceeding
-        audio_file_path = audio_file
-        if not os.path.exists(audio_file_path):
-            raise FileNotFoundError(f"Audio file not found: {audio_file_path}")
-
-        print("Audio file path:", audio_file_path)
-
-        # Start analysis in separate threads
-        threading.Thread(target=facial_emotions_analysis, args=(file_path, interviewId, questionId)).start()
-        threading.Thread(target=analyze_speech_emotion, args=(audio_file_path, interviewId, questionId)).start()
-        threading.Thread(target=analyze_speech_to_text, args=(audio_file_path, interviewId, questionId)).start()
+# Analysis stages. Each one takes the job context plus its declared inputs and
+# returns its declared outputs; raising marks it failed, SkipStage skips it.
 
-        print(f"Processing started for Interview ID: {interviewId}, Question ID: {questionId}")
-
-    except Exception as e:
-        print(f"Error processing video: {str(e)}")
-
-def facial_emotions_analysis(file_path, interviewId, questionId):
-    """Background task for analyzing facial emotions."""
-    # Log a message indicating the background task has started
-    logging.info("Background task for analyzing facial emotions.")
-    
-    # Set the stage to 'started' before processing
-    update_stage(interviewId, questionId, "facialEmotions", "started")
-    
-    try:
-        # Call the facial emotion analysis function
-        prediction = facial_emotion(file_path)
-        
-        # Check if the prediction contains an error
-        if 'error' in prediction:
-            raise Exception(f"Error analyzing facial emotions: {prediction['error']}")
-        
-        # Log the predictions
-        logging.info("Predictions: %s", prediction)
-        
-        # If successful, update the stage to 'success' with prediction data
-        update_stage(interviewId, questionId, "facialEmotions", "success", prediction)
-        
-        logging.info("Facial emotion analysis succeeded.")
-    
-    except Exception as e:
-        # On failure, update the stage to 'failed'
-        update_stage(interviewId, questionId, "facialEmotions", "failed")
-        
-        # Log the error
-        logging.error("Error analyzing facial emotions: %s", str(e))
-    
-    finally:
-        # Cleanup: Remove the file after processing
-        # file_path = os.path.join('recorded_video' filename)
+def download_step(context, video_url, file_path):
+    """Download the recording before any analysis can start."""
+    download_result = download_video(video_url, file_path)
+    if "error" in download_result:
+        print("Error downloading video:", download_result["error"])
         if os.path.exists(file_path):
             os.remove(file_path)
-            logging.info("Removed file: %s", file_path)
-        else:
-            logging.warning("File not found: %s", file_path)
-            
-def analyze_speech_emotion(audio_file_path, interviewId, questionId):
-    """Background task for analyzing speech emotions."""
-    print("Starting background task for analyzing speech emotions.")
-    
-    # Set the initial stage to 'started'
-    update_stage(interviewId, questionId, "speechEmotions", "started")
-    
-    try:
-        # Load the speech emotion recognition model
-        model_path = os.path.join('Models', 'audio.hdf5')
-        if not os.path.exists(model_path):
-            raise FileNotFoundError(f"Model file not found at {model_path}")
-
-        # Initialize the speech emotion recognition model
-        SER = speechEmotionRecognition(model_path)
-        
-        # Perform speech emotion analysis on the provided audio file
-        emotions, _ = SER.predict_emotion_from_file(audio_file_path)
-
-        if not emotions:
-            raise ValueError("No emotions detected in the audio file.")
-
-        # Calculate the major emotion and distribution
-        major_emotion = max(set(emotions), key=emotions.count)    
-        emotion_dist = [int(100 * emotions.count(emotion) / len(emotions)) for emotion in SER._emotion.values()]
-
-        # Prepare the data to be sent in the update
-        data = {
-            'emotions': emotions,
-            'major_emotion': major_emotion,
-            'emotion_dist': emotion_dist
-        }
-
-        print(f"Speech emotion analysis successful: {data}")
-        update_stage(interviewId, questionId, "speechEmotions", "success", data)
-
-    except FileNotFoundError as fnf_error:
-        error_message = f"File not found: {str(fnf_error)}"
-        print(error_message)
-        update_stage(interviewId, questionId, "speechEmotions", "failed")
-
-    except ValueError as val_error:
-        error_message = f"Value error: {str(val_error)}"
-        print(error_message)
-        update_stage(interviewId, questionId, "speechEmotions", "failed")
-
-    except Exception as e:
-        error_message = f"Unexpected error analyzing speech emotions: {str(e)}"
-        print(error_message)
-        update_stage(interviewId, questionId, "speechEmotions", "failed")
-        
-def analyze_speech_to_text(audio_file_path, interviewId, questionId):
-    """Convert speech to text and analyze the comparison."""
-    print("Starting speech-to-text conversion.")
-
-    # Set the initial stage to 'started'
-    update_stage(interviewId, questionId, "transcript", "started")
-
-    try:
-        # Perform speech-to-text conversion
-        text, error = speech_to_text(audio_file_path)
+        raise Exception(download_result["error"])
+
+    print("Processing video:", file_path)
+    return {"video_path": file_path}
+
+def demux_step(context, video_path):
+    """Decode the audio (and with MEDIA_DEMUX the frames) once for every analyzer, then detect speech."""
+    frames = frame_timestamps = None
+    if MEDIA_DEMUX:
+        # One ffmpeg pass: downscaled grayscale frames plus 16 kHz mono PCM
+        media = decode_media(video_path)
+        if "error" in media:
+            raise Exception(media["error"])
+        audio, frames, frame_timestamps = media["audio"], media["frames"], media["timestamps"]
+        print(f"Decoded {len(frames)} frames")
+    else:
+        # Decode the audio once to 16 kHz mono PCM shared by both speech analyzers
+        audio = decode_audio(video_path)
+        if isinstance(audio, dict) and "error" in audio:
+            raise Exception(audio["error"])
 
-        if error:
-            raise Exception(error)
+    print(f"Decoded {len(audio)} audio samples")
 
-        if not text or len(text.strip()) == 0:
-            raise ValueError("Transcription resulted in empty text.")
+    return {"audio": audio, "frames": frames, "frame_timestamps": frame_timestamps, "speech_map": speech_map_for(audio)}
 
-        # Log and update the successful transcript result
-        print(f"Transcription successful. Transcribed text: {text}")
-        update_stage(interviewId, questionId, "transcript", "success", text)
+def speech_map_for(audio):
+    """Speech map shared by both speech analyzers, or None when VAD is off."""
+    # A recording without an audio track has no speech either
+    if not VAD_ENABLED and len(audio) > 0:
+        return None
+    speech_map = detect_speech(audio)
+    print(f"Detected {speech_map.speech_seconds}s of speech")
+    return speech_map
 
-        # Fetch question details from the database
-        print("Fetching question details from the database.")
-        question_details = get_question_details(questionId)
+def facial_step(context, video_path, frames, frame_timestamps):
+    """Analyze facial emotions, from the file or pre-decoded frames."""
+    prediction = stage_pools.run("facial", facial_emotion, video_path, frames=frames, frame_timestamps=frame_timestamps, **tier_settings(context["tier"])["facial"])
 
-        if not question_details:
-            raise ValueError(f"No question found for questionId: {questionId}")
+    if 'error' in prediction:
+        raise Exception(f"Error analyzing facial emotions: {prediction['error']}")
 
-        # Extract the correct answer from question details
-        correct_answer = question_details.get('answer')
+    logging.info("Predictions: %s", prediction)
+    return {"facialEmotions": prediction}
 
-        if not correct_answer:
-            raise ValueError(f"No answer found in question details for questionId: {questionId}")
+def speech_emotion_step(context, audio, speech_map):
+    """Classify speech emotions over the voiced chunks of the decoded audio."""
+    if speech_map is not None and not speech_map.has_speech:
+        raise SkipStage("no_speech")
 
-        # Start the comparison analysis in a separate thread
-        print("Starting comparison analysis in a separate thread.")
-        threading.Thread(
-            target=perform_comparison_analysis,
-            args=(interviewId, questionId, text, correct_answer)
-        ).start()
+    # A model server checks its own weights
+    if SER_MODEL_PATH is not None and not os.path.exists(SER_MODEL_PATH):
+        raise FileNotFoundError(f"Model file not found at {SER_MODEL_PATH}")
 
-    except FileNotFoundError as fnf_error:
-        error_message = f"Audio file not found: {str(fnf_error)}"
-        print(error_message)
-        update_stage(interviewId, questionId, "transcript", "failed")
-        update_stage(interviewId, questionId, "comparisonScore", "failed")
+    # Shared model, or in the stage's process pool
+    emotions, labels = stage_pools.run("speech_emotion", predict_speech_emotions, audio, speech_map)
 
-    except ValueError as val_error:
-        error_message = f"Value error: {str(val_error)}"
-        print(error_message)
-        update_stage(interviewId, questionId, "transcript", "failed")
-        update_stage(interviewId, questionId, "comparisonScore", "failed")
+    if not emotions:
+        raise ValueError("No emotions detected in the audio file.")
 
-    except Exception as e:
-        error_message = f"Error during speech-to-text conversion: {str(e)}"
-        print(error_message)
-        update_stage(interviewId, questionId, "transcript", "failed")
-        update_stage(interviewId, questionId, "comparisonScore", "failed")
+    # Calculate the major emotion and distribution
+    major_emotion = max(set(emotions), key=emotions.count)
+    emotion_dist = [int(100 * emotions.count(emotion) / len(emotions)) for emotion in labels]
 
-def perform_comparison_analysis(interviewId, questionId, transcript, correct_answer):
-    """Perform comparison analysis and update the comparison score."""
-    try:
-        update_stage(interviewId, questionId, "comparisonScore", "started")
+    data = {
+        'emotions': emotions,
+        'major_emotion': major_emotion,
+        'emotion_dist': emotion_dist
+    }
 
-        # Calculate the comparison score
-        comparison_score = compare(transcript, correct_answer)
-        
-        comparison_score = float(comparison_score)
-
-        print(f"Comparison successful. Score: {comparison_score}%")
-        update_stage(
-            interviewId,
-            questionId,
-            "comparisonScore",
-            "success",
-            comparison_score
+    print(f"Speech emotion analysis successful: {data}")
+    return {"speechEmotions": data}
+
+def transcript_step(context, audio, speech_map):
+    """Convert the decoded speech to text with the tier's Whisper model."""
+    if speech_map is not None and not speech_map.has_speech:
+        raise SkipStage("no_speech")
+
+    text, error = stage_pools.run("transcript", speech_to_text, audio, speech_map=speech_map, model_id=tier_settings(context["tier"])["whisper"])
+
+    if error:
+        raise Exception(error)
+
+    if not text or len(text.strip()) == 0:
+        raise ValueError("Transcription resulted in empty text.")
+
+    print(f"Transcription successful. Transcribed text: {text}")
+    return {"transcript": text}
+
+def comparison_step(context, transcript):
+    """Score the transcript against the question's reference answer."""
+    questionId = context["questionId"]
+    question_details = get_question_details(questionId)
+
+    if not question_details:
+        raise ValueError(f"No question found for questionId: {questionId}")
+
+    correct_answer = question_details.get('answer')
+
+    if not correct_answer:
+        raise ValueError(f"No answer found in question details for questionId: {questionId}")
+
+    comparison_score = float(compare(transcript, correct_answer, question_id=questionId, model_id=tier_settings(context["tier"])["sentence"]))
+
+    print(f"Comparison successful. Score: {comparison_score}%")
+    return {"comparisonScore": comparison_score}
+
+def remove_video(file_path):
+    """Delete the downloaded recording once facial analysis and decoding are done with it."""
+    if os.path.exists(file_path):
+        os.remove(file_path)
+        logging.info("Removed file: %s", file_path)
+
+# Download and demux run inline on the "video" worker, the analyzers on their own executor stages
+ANALYSIS_PIPELINE = Pipeline([
+    Stage("download", download_step, inputs=("video_url", "file_path"), outputs=("video_path",), field="download"),
+    Stage("demux", demux_step, inputs=("video_path",), outputs=("audio", "frames", "frame_timestamps", "speech_map")),
+    Stage("facial", facial_step, inputs=("video_path", "frames", "frame_timestamps"), outputs=("facialEmotions",),
+          executor_stage="facial", field="facialEmotions"),
+    Stage("speech_emotion", speech_emotion_step, inputs=("audio", "speech_map"), outputs=("speechEmotions",),
+          executor_stage="speech_emotion", field="speechEmotions"),
+    Stage("transcript", transcript_step, inputs=("audio", "speech_map"), outputs=("transcript",),
+          executor_stage="transcript", field="transcript"),
+    Stage("comparison", comparison_step, inputs=("transcript",), outputs=("comparisonScore",),
+          executor_stage="comparison", field="comparisonScore"),
+], release={"video_path": remove_video})
+
+def record_stage(context, stage, record, outputs):
+    """Pipeline listener: mirror stage transitions and timings onto the response's stage fields."""
+    if stage.field is None:
+        return
+
+    interviewId, questionId = context["interviewId"], context["questionId"]
+    tier = context["tier"] if stage.name != "download" else None
+    status = record["status"]
+
+    if status == "running":
+        update_stage(interviewId, questionId, stage.field, "started", tier=tier, started_at=record["started_at"])
+    elif status == "success":
+        update_stage(interviewId, questionId, stage.field, "success", outputs.get(stage.field), tier=tier,
+                     finished_at=record["finished_at"])
+    elif status == "failed":
+        update_stage(interviewId, questionId, stage.field, "failed", tier=tier, finished_at=record["finished_at"], error=record["error"])
+    elif status == "skipped":
+        # "no_speech", or "failed" when a stage it depends on failed
+        update_stage(interviewId, questionId, stage.field, record["reason"], tier=tier, finished_at=record["finished_at"])
+
+def process_video(video_url, file_path, interviewId, questionId, tier=DEFAULT_TIER, wait=False):
+    """
+    Background task for downloading and processing video with the models of the given tier.
+    With wait the call returns once every stage has finished and raises when the video could
+    not be downloaded or decoded, so a job queue lease covers the whole analysis.
+    """
+    context = {"interviewId": interviewId, "questionId": questionId, "tier": tier}
+    run = ANALYSIS_PIPELINE.start(executor, context, {"video_url": video_url, "file_path": file_path}, record_stage)
+    print(f"Processing started for Interview ID: {interviewId}, Question ID: {questionId}")
+
+    if wait:
+        run.wait()
+        for name in ("download", "demux"):
+            if run.records[name]["status"] == "failed":
+                raise Exception(run.records[name]["error"])
+
+def run_process_video_job(videoUrl, interviewId, questionId, tier=DEFAULT_TIER):
+    """Job queue handler: the claiming node downloads to its own upload folder."""
+    save_path = os.path.join(UPLOAD_FOLDER, f"{interviewId + questionId}.mp4")
+    process_video(videoUrl, save_path, interviewId, questionId, tier, wait=True)
+
+def fail_unfinished_stages(payload, error):
+    """Job queue failure handler: stages left queued or started by the abandoned job are marked failed."""
+    for field in ("download", "facialEmotions", "speechEmotions", "transcript", "comparisonScore"):
+        interviews_collection.update_one(
+            {
+                "_id": ObjectId(payload["interviewId"]),
+                "responses": {"$elemMatch": {
+                    "questionId": ObjectId(payload["questionId"]),
+                    f"{field}.stage": {"$in": ["queued", "started"]},
+                }},
+            },
+            {"$set": {f"responses.$.{field}.stage": "failed"}}
         )
+    print(f"Job for Interview ID: {payload['interviewId']}, Question ID: {payload['questionId']} failed: {error}")
 
-    except Exception as e:
-        error_message = f"Error during comparison analysis: {str(e)}"
-        print(error_message)
-        update_stage(interviewId, questionId, "comparisonScore", "failed")
+# Claims process-video jobs in this process (started per worker, see gunicorn.conf.py and job_worker.py)
+job_worker = JobWorker(job_queue, {"process_video": run_process_video_job}, {"process_video": fail_unfinished_stages})
 
 
+def busy_response(error):
+    """429 response telling the client when to resubmit a rejected job."""
+    response = jsonify({"error": "Server is busy, please retry later", "stage": error.stage, "retryAfter": error.retry_after})
+    response.headers["Retry-After"] = str(error.retry_after)
+    return response, 429
 
-@app.route("/api/python/process-video", methods=["POST"])
+@api.route("/api/python/process-video", methods=["POST"])
 def process_video_api():
     """API endpoint to process a video."""
     try:
@@ -308,24 +335,34 @@ def process_video_api():
         if not interviewId or not questionId or not videoUrl:
             return jsonify({"error": "Missing required parameters"}), 400
 
+        # Model tier: fast, balanced or accurate
+        try:
+            tier = resolve_tier(data.get("tier"))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        if JOB_QUEUE_ENABLED:
+            # Durable intake: any worker node claims the job, and it is dispatched again if that worker dies
+            job_id = job_queue.enqueue("process_video", {"videoUrl": videoUrl, "interviewId": interviewId, "questionId": questionId, "tier": tier})
+            update_stage(interviewId, questionId, "download", "queued")
+            return jsonify({"message": "Video processing queued", "interviewId": interviewId, "questionId": questionId, "tier": tier, "jobId": str(job_id)}), 202
+
         # Generate a unique filename for the video
         video_filename = f"{interviewId + questionId}.mp4"
         save_path = os.path.join(UPLOAD_FOLDER, video_filename)
 
-        # Download the video
-        download_result = download_video(videoUrl, save_path)
-        if "error" in download_result:
-            return jsonify({"error": download_result["error"]}), 400
-
-        # Start video processing in a background thread
-        threading.Thread(target=process_video, args=(save_path, interviewId, questionId)).start()
+        # Queue download and processing, rejecting the job when the pipeline is saturated
+        try:
+            executor.submit("video", process_video, videoUrl, save_path, interviewId, questionId, tier)
+        except QueueFullError as e:
+            return busy_response(e)
 
-        return jsonify({"message": "Video processing started successfully", "interviewId": interviewId, "questionId": questionId}), 202
+        return jsonify({"message": "Video processing started successfully", "interviewId": interviewId, "questionId": questionId, "tier": tier}), 202
 
     except Exception as e:
         return jsonify({"error": f"Internal server error: {str(e)}"}), 500
 
-@app.route('/api/python/retry-analysis',methods=["POST"])
+@api.route('/api/python/retry-analysis',methods=["POST"])
 def retryAnalysis():
     try:
         data = request.json;
@@ -335,6 +372,12 @@ def retryAnalysis():
         
         if not resType or not responseId or not interviewId:
             return jsonify({"error": "Missing required parameters"}), 400
+
+        # Model tier: fast, balanced or accurate
+        try:
+            tier = resolve_tier(data.get("tier"))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
         
         interviewResponse = get_response_details(interviewId, responseId)
         questionId = interviewResponse["questionId"]
@@ -348,49 +391,125 @@ def retryAnalysis():
         if "error" in download_result:
             return jsonify({"error": download_result["error"]}), 400
         
-        audio_file = extract_audio(save_path)
-        if isinstance(audio_file, dict) and "error" in audio_file:
-            print("Error in audio extraction:", audio_file["error"])
-            raise Exception(audio_file["error"])
-
-        if not os.path.exists(audio_file):
-            raise FileNotFoundError(f"Audio file not found: {audio_file}")
+        audio = decode_audio(save_path)
+        if os.path.exists(save_path):
+            os.remove(save_path)
+        if isinstance(audio, dict) and "error" in audio:
+            print("Error in audio extraction:", audio["error"])
+            raise Exception(audio["error"])
         
+        # Re-run only the requested part of the analysis pipeline
+        context = {"interviewId": interviewId, "questionId": questionId, "tier": tier}
         if resType == 'transcript':
-            threading.Thread(target=analyze_speech_to_text, args=(audio_file, interviewId, questionId)).start()
+            ANALYSIS_PIPELINE.select(["transcript", "comparison"]).start(
+                executor, context, {"audio": audio, "speech_map": speech_map_for(audio)}, record_stage, block=False)
             
         if resType == 'comparisionScore':
-            question_details = get_question_details(questionId)
-
-            if not question_details:
-                raise ValueError(f"No question found for questionId: {questionId}")
-
-            # Extract the correct answer from question details
-            correct_answer = question_details.get('answer')
-
-            if not correct_answer:
-                raise ValueError(f"No answer found in question details for questionId: {questionId}")
-            
-            threading.Thread(target=perform_comparison_analysis, args=(interviewId, questionId, interviewResponse['transcript']['data'], correct_answer)).start()
+            ANALYSIS_PIPELINE.select(["comparison"]).start(
+                executor, context, {"transcript": interviewResponse['transcript']['data']}, record_stage, block=False)
         
         
-        return jsonify({"message" : "Processing Started"}), 200
+        return jsonify({"message" : "Processing Started", "tier": tier}), 200
         
+    except QueueFullError as e:
+        return busy_response(e)
         
     except Exception as e:
         return jsonify({"error": f"Internal server error: {str(e)}"}), 500
 
-@app.route('/testroute', methods=['GET'])
+@api.route('/api/python/precompute-embeddings', methods=['POST'])
+def precompute_embeddings():
+    """Encode and cache reference-answer embeddings for a question bank."""
+    try:
+        data = request.json or {}
+        questionIds = data.get("questionIds")
+
+        # Embeddings are cached per sentence model, so warm the one the tier uses
+        try:
+            tier = resolve_tier(data.get("tier"))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        query = {"answer": {"$exists": True}}
+        if questionIds:
+            query["_id"] = {"$in": [ObjectId(questionId) for questionId in questionIds]}
+
+        questions = list(questions_collection.find(query, {"answer": 1}))
+        executor.submit("comparison", precompute_answer_embeddings, questions, 64, tier_settings(tier)["sentence"])
+
+        return jsonify({"message": "Embedding precomputation started", "questions": len(questions)}), 202
+
+    except QueueFullError as e:
+        return busy_response(e)
+
+    except Exception as e:
+        return jsonify({"error": f"Internal server error: {str(e)}"}), 500
+
+@api.route('/api/python/models', methods=['GET'])
+def model_stats():
+    """Report which models are resident in this worker, or in the model server."""
+    if MODEL_SERVER_SOCKET:
+        return jsonify(server_stats()), 200
+    return jsonify(registry.stats()), 200
+
+@api.route('/api/python/queue-stats', methods=['GET'])
+def queue_stats():
+    """Report queue depth, wait times and throughput for each stage."""
+    return jsonify(executor.stats()), 200
+
+@api.route('/api/python/cpu-budget', methods=['GET'])
+def cpu_budget():
+    """Report the cores and threads given to each analyzer stage."""
+    if not CPU_BUDGET_ENABLED:
+        return jsonify({"enabled": False}), 200
+    return jsonify({"enabled": True, "mode": stage_pools.mode, "stages": plan_budget()}), 200
+
+@api.route('/api/python/job-stats', methods=['GET'])
+def job_stats():
+    """Report the number of queued, running, done and failed jobs."""
+    if not JOB_QUEUE_ENABLED:
+        return jsonify({"enabled": False}), 200
+    return jsonify({"enabled": True, **job_queue.stats()}), 200
+
+@api.route('/api/python/broker-stats', methods=['GET'])
+def broker_stats():
+    """Report batch sizes and batching delay for each brokered model."""
+    return jsonify(broker.stats()), 200
+
+@api.route('/testroute', methods=['GET'])
 def testPing():
      return { "message" : "successfully fetched interview details new!"}, 200
 
-@app.after_request
+@api.after_app_request
 def cleanup(response):
     """Clean up memory after each request to avoid memory leaks."""
     gc.collect()  # Force garbage collection
     return response
 
+def create_app(preload_models=PRELOAD_MODELS):
+    """Build the Flask app. Under gunicorn this runs once in the master when preload_app is set."""
+    for folder in (UPLOAD_FOLDER, AUDIO_FOLDER):
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+
+    app = Flask(__name__)
+    CORS(app)
+    app.register_blueprint(api)
+
+    # Thread budgets for the analyzers sharing this process, set before any model is loaded
+    if CPU_BUDGET_ENABLED and stage_pools.mode == "thread" and not MODEL_SERVER_SOCKET:
+        install_cpu_budget(executor)
+
+    if preload_models:
+        registry.preload()
+
+    return app
+
+app = create_app()
+
 if __name__ == "__main__":
+    if JOB_QUEUE_ENABLED:
+        job_worker.start()
     app.run(port=8080,debug=(flask_env == 'development'))
 
 
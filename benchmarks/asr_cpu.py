@@ -0,0 +1,82 @@
+"""
+WER vs latency of the float32 and int8 Whisper paths on CPU.
+
+    python -m benchmarks.asr_cpu --audio answer.wav --reference answer.txt --threads 4
+
+--audio is any file ffmpeg can read (a recorded answer video works too) and
+--reference is its ground-truth transcript. Each mode is loaded once, warmed
+up, then timed over --runs transcriptions.
+"""
+import argparse
+import json
+import re
+import time
+
+import torch
+
+from src.speech_to_text import configure_torch_threads, load_whisper_pipeline, WHISPER_MODEL_ID
+from utils.extract_audio import decode_audio
+
+
+def normalize(text):
+    return re.sub(r"[^a-z0-9' ]+", " ", text.lower()).split()
+
+
+def word_error_rate(reference, hypothesis):
+    """Word-level Levenshtein distance divided by the reference length."""
+    ref, hyp = normalize(reference), normalize(hypothesis)
+    previous = list(range(len(hyp) + 1))
+    for i, ref_word in enumerate(ref, 1):
+        current = [i] + [0] * len(hyp)
+        for j, hyp_word in enumerate(hyp, 1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ref_word != hyp_word))
+        previous = current
+    return previous[-1] / max(1, len(ref))
+
+
+def benchmark(mode, audio, reference, model_id, runs):
+    start = time.perf_counter()
+    pipe = load_whisper_pipeline(model_id, cpu_int8=(mode == "int8"))
+    load_s = time.perf_counter() - start
+
+    # Warm-up run is not timed
+    pipe({"raw": audio, "sampling_rate": 16000}, return_timestamps=True)
+
+    latencies = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        text = pipe({"raw": audio, "sampling_rate": 16000}, return_timestamps=True)["text"]
+        latencies.append(time.perf_counter() - start)
+
+    return {
+        "mode": mode,
+        "load_s": round(load_s, 2),
+        "latency_s": round(sorted(latencies)[len(latencies) // 2], 2),
+        "real_time_factor": round(sorted(latencies)[len(latencies) // 2] / (len(audio) / 16000), 3),
+        "wer": round(word_error_rate(reference, text), 4),
+        "text": text,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare float32 and int8 Whisper on CPU")
+    parser.add_argument("--audio", required=True)
+    parser.add_argument("--reference", required=True, help="Text file with the reference transcript")
+    parser.add_argument("--model", default=WHISPER_MODEL_ID)
+    parser.add_argument("--threads", type=int, default=0, help="torch intra-op threads (0 = torch default)")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    configure_torch_threads(args.threads)
+    audio = decode_audio(args.audio)
+    if isinstance(audio, dict):
+        raise SystemExit(audio["error"])
+    with open(args.reference) as f:
+        reference = f.read()
+
+    results = [benchmark(mode, audio, reference, args.model, args.runs) for mode in ("float32", "int8")]
+    print(json.dumps({"audio_s": round(len(audio) / 16000, 1), "threads": torch.get_num_threads(), "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
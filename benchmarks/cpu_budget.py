@@ -0,0 +1,99 @@
+"""
+Throughput of concurrent analysis jobs with and without the CPU budget.
+
+    python -m benchmarks.cpu_budget --video answer.mp4 --jobs 6
+
+Every job runs facial emotion, speech emotion and speech-to-text on the
+same decoded recording, on the regular stage executor. Each mode runs in
+a fresh interpreter because TensorFlow and PyTorch only accept thread
+settings before their runtimes start.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+
+def run_jobs(video, jobs):
+    """Run jobs concurrent analyses in this process and return timings."""
+    from utils.cpu_budget import CPU_BUDGET_ENABLED, install, plan_budget
+    from utils.executor import executor
+
+    if CPU_BUDGET_ENABLED:
+        install(executor)
+
+    from src.facial_emotion import facial_emotion
+    from src.speech_emotion1 import predict_speech_emotions
+    from src.speech_to_text import speech_to_text
+    from utils.media_decode import decode_media
+    from utils.model_registry import registry
+
+    media = decode_media(video)
+    if "error" in media:
+        raise SystemExit(media["error"])
+    registry.preload(["facial", "speech_emotion", "whisper"])
+
+    def analyze():
+        futures = [
+            executor.submit("facial", facial_emotion, video, frames=media["frames"], frame_timestamps=media["timestamps"], block=True),
+            executor.submit("speech_emotion", predict_speech_emotions, media["audio"], block=True),
+            executor.submit("transcript", speech_to_text, media["audio"], block=True),
+        ]
+        return futures
+
+    # Warm-up job, not timed
+    for future in analyze():
+        future.result()
+
+    start = time.perf_counter()
+    futures = [future for _ in range(jobs) for future in analyze()]
+    for future in futures:
+        future.result()
+    elapsed = time.perf_counter() - start
+
+    return {
+        "budget": CPU_BUDGET_ENABLED,
+        "jobs": jobs,
+        "elapsed_s": round(elapsed, 2),
+        "jobs_per_min": round(60 * jobs / elapsed, 2),
+        "stages": executor.stats(),
+        "plan": plan_budget() if CPU_BUDGET_ENABLED else None,
+    }
+
+
+def run_mode(budget, args):
+    env = dict(os.environ, CPU_BUDGET="true" if budget else "false", CPU_BUDGET_AFFINITY="true" if args.affinity else "false")
+    if budget:
+        # Same caps gunicorn.conf.py applies before numpy is imported
+        from utils.cpu_budget import NATIVE_THREAD_ENV, plan_budget
+        threads = str(min(stage["threads"] for stage in plan_budget().values()))
+        env.update({name: threads for name in NATIVE_THREAD_ENV})
+    command = [sys.executable, "-m", "benchmarks.cpu_budget", "--video", args.video, "--jobs", str(args.jobs), "--child"]
+    output = subprocess.run(command, env=env, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare analysis throughput with and without the CPU budget")
+    parser.add_argument("--video", required=True)
+    parser.add_argument("--jobs", type=int, default=6, help="Concurrent jobs per measurement")
+    parser.add_argument("--affinity", action="store_true", help="Also pin stage threads to their cores")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        print(json.dumps(run_jobs(args.video, args.jobs)))
+        return
+
+    results = [run_mode(budget, args) for budget in (False, True)]
+    print(json.dumps({
+        "cores": os.cpu_count(),
+        "speedup": round(results[1]["jobs_per_min"] / results[0]["jobs_per_min"], 2),
+        "results": results,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
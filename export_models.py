@@ -0,0 +1,138 @@
+"""
+Export the facial and speech emotion Keras models to ONNX or TFLite and
+check the exported outputs against Keras.
+
+    python export_models.py --model facial --format onnx --quantize int8
+    python export_models.py --model speech --format tflite --quantize fp16
+
+The exported file is written next to the Keras weights (Models/video.onnx,
+Models/audio.tflite, ...) where EMOTION_BACKEND=onnx|tflite picks it up.
+
+ONNX is the lightweight option: onnxruntime never loads TensorFlow. TFLite
+models are exported with builtin ops when possible and then run on the
+standalone runtime (pip install ai-edge-litert). When a layer has no
+builtin the export falls back to TF ops (reported as "flex": true), and
+such a model still needs full TensorFlow at inference time.
+
+Parity is checked on random inputs and, with --recording, on real inputs:
+face crops detected in a video for the facial model, log-mel chunks of
+the recording's audio for the speech model.
+
+    python export_models.py --model facial --format onnx --recording answer.mp4
+"""
+import argparse
+import json
+import sys
+
+import numpy as np
+
+from src.inference_backend import (
+    OnnxBackend, TFLiteBackend, backend_path, check_parity, export_onnx, export_tflite
+)
+
+# Keras weights, per-sample input shape and a generator of representative inputs
+MODELS = {
+    "facial": {
+        "path": "Models/video.h5",
+        "input_shape": (48, 48, 1),
+        # Normalised grayscale face crops in [0, 1]
+        "sample": lambda rng, n: rng.uniform(0, 1, (n, 48, 48, 1)).astype(np.float32),
+    },
+    "speech": {
+        "path": "Models/audio.hdf5",
+        "input_shape": (5, 128, 128, 1),
+        # Log-mel windows in dB relative to the chunk maximum
+        "sample": lambda rng, n: rng.uniform(-80, 0, (n, 5, 128, 128, 1)).astype(np.float32),
+    },
+}
+
+
+def load_keras_model(name):
+    if name == "facial":
+        from tensorflow.keras.models import load_model
+        return load_model(MODELS[name]["path"], compile=False)
+
+    from src.speech_emotion1 import speechEmotionRecognition
+    ser = speechEmotionRecognition()
+    model = ser.build_model()
+    model.load_weights(MODELS[name]["path"])
+    return model
+
+
+def face_crops(recording, n):
+    """Up to n face crops from a video, preprocessed like the analyzer does."""
+    import cv2
+    import dlib
+    from src.facial_emotion import capture_frames, preprocess_face
+
+    detector = dlib.get_frontal_face_detector()
+    capture = cv2.VideoCapture(recording)
+    crops = []
+    for _, gray in capture_frames(capture):
+        crops.extend(preprocess_face(gray, rect) for rect in detector(gray, 1))
+        if len(crops) >= n:
+            break
+    capture.release()
+    return np.stack(crops[:n]) if crops else None
+
+
+def speech_chunks(recording, n):
+    """Up to n model inputs (log-mel chunks) from the recording's audio."""
+    from src.speech_emotion1 import speechEmotionRecognition
+    from utils.extract_audio import decode_audio
+
+    audio = decode_audio(recording)
+    if isinstance(audio, dict):
+        raise SystemExit(audio["error"])
+    X = speechEmotionRecognition().chunk_inputs(audio)
+    return X[:n].astype(np.float32) if len(X) else None
+
+
+REAL_SAMPLES = {"facial": face_crops, "speech": speech_chunks}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export emotion models to ONNX / TFLite")
+    parser.add_argument("--model", choices=list(MODELS), required=True)
+    parser.add_argument("--format", choices=["onnx", "tflite"], required=True)
+    parser.add_argument("--quantize", choices=["none", "fp16", "int8"], default="none")
+    parser.add_argument("--output", help="Output path (defaults to Models/<name>.<format>)")
+    parser.add_argument("--samples", type=int, default=16, help="Batch size for the parity check")
+    parser.add_argument("--atol", type=float, default=None, help="Max abs probability difference allowed")
+    parser.add_argument("--recording", help="Video/audio file for a second parity check on real inputs")
+    args = parser.parse_args(argv)
+
+    spec = MODELS[args.model]
+    quantize = None if args.quantize == "none" else args.quantize
+    output = args.output or backend_path(spec["path"], args.format)
+
+    model = load_keras_model(args.model)
+    flex = False
+    if args.format == "onnx":
+        export_onnx(model, output, (None,) + spec["input_shape"], quantize)
+        backend = OnnxBackend(output)
+    else:
+        flex = export_tflite(model, output, quantize)
+        backend = TFLiteBackend(output)
+
+    # Quantised weights are expected to drift more than float exports
+    atol = args.atol if args.atol is not None else (5e-2 if quantize == "int8" else 1e-2 if quantize == "fp16" else 1e-4)
+    reference = lambda x: model(x, training=False).numpy()
+    sample = spec["sample"](np.random.default_rng(0), args.samples)
+    parity = check_parity(reference, backend, sample, atol)
+    result = {"model": args.model, "format": args.format, "quantize": args.quantize, "output": output, "flex": flex, **parity}
+    passed = parity["within_tolerance"]
+
+    if args.recording:
+        real = REAL_SAMPLES[args.model](args.recording, args.samples)
+        if real is None:
+            raise SystemExit(f"No {'faces' if args.model == 'facial' else 'audio chunks'} found in {args.recording}")
+        result["recording"] = {"path": args.recording, "samples": len(real), **check_parity(reference, backend, real, atol)}
+        passed = passed and result["recording"]["within_tolerance"]
+
+    print(json.dumps(result, indent=2))
+    return 0 if passed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,96 @@
+"""
+Gunicorn production profile.
+
+    gunicorn -c gunicorn.conf.py
+
+The app is imported once in the master (preload_app) and the PyTorch models
+(Whisper, MiniLM) are loaded there before forking, so workers share their
+weight pages copy-on-write. TensorFlow is not fork-safe, so the Keras
+models (facial, speech emotion) are loaded in each worker after the fork.
+Mongo clients are never inherited: each worker connects on first use.
+"""
+import os
+
+from dotenv import load_dotenv
+
+# Load .env before the project modules, which read their flags at import time
+load_dotenv()
+
+from utils.cpu_budget import CPU_BUDGET_ENABLED, limit_native_threads_env
+from utils.database.connection import mongo
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8080')}"
+wsgi_app = "app:app"
+
+# Threaded workers: requests only queue jobs, analysis runs on the stage executors
+worker_class = "gthread"
+workers = int(os.getenv("GUNICORN_WORKERS", "2"))
+threads = int(os.getenv("GUNICORN_THREADS", "4"))
+
+# Every worker runs its own analyzers, so each plans its CPU budget within a 1/workers slice of the host
+os.environ.setdefault("CPU_BUDGET_PROCESSES", str(workers))
+# BLAS / OpenMP read their thread counts when numpy is first imported, which happens with the app below
+if CPU_BUDGET_ENABLED:
+    limit_native_threads_env()
+
+# Model loading and in-request downloads (retry-analysis) can take minutes
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "300"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "120"))
+keepalive = 5
+
+# Recycle workers now and then as a guard against memory creep, staggered so they do not restart together.
+# Only on by default with the durable job queue: a recycle kills the analyses running on the worker's
+# stage executors, and without the queue nothing dispatches them again.
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "500" if os.getenv("JOB_QUEUE", "false").lower() == "true" else "0"))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", "50"))
+
+preload_app = os.getenv("GUNICORN_PRELOAD_APP", "true").lower() == "true"
+# Heartbeat files on tmpfs so a busy disk cannot stall workers
+worker_tmp_dir = "/dev/shm" if os.path.isdir("/dev/shm") else None
+
+accesslog = "-"
+errorlog = "-"
+
+# Models loaded in the master and shared copy-on-write, and models each worker loads for itself
+MASTER_MODELS = [name for name in os.getenv("GUNICORN_MASTER_MODELS", "whisper,minilm").split(",") if name]
+WORKER_MODELS = [name for name in os.getenv("GUNICORN_WORKER_MODELS", "facial,speech_emotion").split(",") if name]
+
+# Workers talking to a model server (model_server.py) load no models at all
+if os.getenv("MODEL_SERVER_SOCKET"):
+    MASTER_MODELS = WORKER_MODELS = []
+# With STAGE_EXECUTION=process the analyzer models live in the stage pools, only the comparison encoder stays
+elif os.getenv("STAGE_EXECUTION", "thread").lower() == "process":
+    MASTER_MODELS = [name for name in MASTER_MODELS if name == "minilm"]
+    WORKER_MODELS = []
+
+# The hooks below load the models, so the app factory must not
+os.environ["PRELOAD_MODELS"] = "false"
+
+
+def when_ready(server):
+    # Runs in the master before the first workers are forked
+    if preload_app and MASTER_MODELS:
+        from utils.model_registry import registry
+        server.log.info("Loading %s in the master", ", ".join(MASTER_MODELS))
+        registry.preload(MASTER_MODELS)
+
+
+def post_fork(server, worker):
+    # Never reuse a client (and its sockets) created before the fork
+    mongo.reset()
+    # Core slice of this worker's CPU budget (worker ages keep growing, so after restarts slices may overlap)
+    os.environ["CPU_BUDGET_SLOT"] = str(worker.age % workers)
+
+
+def post_worker_init(worker):
+    # Models already inherited from the master are skipped
+    names = WORKER_MODELS + MASTER_MODELS
+    if names:
+        from utils.model_registry import registry
+        worker.log.info("Loading %s in worker %s", ", ".join(names), worker.pid)
+        registry.preload(names)
+
+    # Claim durable jobs in this worker (JOB_WORKERS=0 leaves that to job_worker.py nodes)
+    import app
+    if app.JOB_QUEUE_ENABLED:
+        app.job_worker.start()
@@ -0,0 +1,40 @@
+"""
+Standalone worker node for the durable job queue (JOB_QUEUE=true).
+
+    JOB_QUEUE=true python job_worker.py --threads 2
+
+Claims process-video jobs from the shared jobs collection, so processing
+capacity scales by adding nodes running this script next to (or instead
+of) the web workers. Stopping the node abandons its leases, and the jobs
+are dispatched again once the leases expire.
+"""
+import argparse
+import signal
+import threading
+
+from dotenv import load_dotenv
+
+# Load .env before the project modules, which read their flags at import time
+load_dotenv()
+
+from app import job_worker, job_queue
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Process queued analysis jobs")
+    parser.add_argument("--threads", type=int, default=None, help="Claiming threads (defaults to JOB_WORKERS, at least 1)")
+    args = parser.parse_args(argv)
+
+    stopped = threading.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: stopped.set())
+
+    job_worker.start(args.threads or max(1, job_worker.threads))
+    print(f"Job worker {job_queue.owner} started")
+
+    stopped.wait()
+    job_worker.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+"""
+Local inference daemon that owns every model (Whisper, MiniLM, facial and
+speech emotion) so web workers do not have to.
+
+    MODEL_SERVER_SOCKET=/tmp/dpu-models.sock python model_server.py --preload
+
+Start gunicorn with the same MODEL_SERVER_SOCKET and app.py imports the
+thin adapters in utils/model_client.py instead of src/, so workers never
+import torch or TensorFlow. Arrays travel through shared memory, and video
+paths are opened by the server, so both must run on the same host and
+filesystem. Video paths must be absolute (the adapters make them so): the
+server's working directory is not the client's. INFERENCE_BROKER=true here
+batches model calls across all web workers.
+
+Client requests are unpickled, so the socket always requires a key. Set
+MODEL_SERVER_AUTHKEY on both sides, or leave it unset and the server
+generates a random key into <socket>.key (mode 0600), which clients
+running as the same user read on connect.
+"""
+import argparse
+import logging
+
+from dotenv import load_dotenv
+
+# Load .env before the project modules, which read their flags at import time
+load_dotenv()
+
+from utils.model_server import serve, MODEL_SERVER_SOCKET
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the analysis models over a Unix socket")
+    parser.add_argument("--socket", default=MODEL_SERVER_SOCKET, help="Socket path (defaults to MODEL_SERVER_SOCKET)")
+    parser.add_argument("--preload", action="store_true", help="Load every model before accepting connections")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    serve(args.socket, preload=args.preload)
+
+
+if __name__ == "__main__":
+    main()
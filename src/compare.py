@@ -3,7 +3,34 @@ from flask import jsonify
 
 from sentence_transformers import SentenceTransformer
 
-def compare(result , answers):
+from utils.model_registry import registry
+from utils.inference_broker import broker, BROKER_ENABLED
+from utils.embedding_cache import EmbeddingCache
+
+SENTENCE_MODEL_ID = 'sentence-transformers/all-MiniLM-L12-v2'
+
+registry.register("minilm", lambda: SentenceTransformer(SENTENCE_MODEL_ID))
+
+def sentence_model_name(model_id=SENTENCE_MODEL_ID):
+    """Registry name of the sentence encoder for model_id, registering other variants on first use."""
+    if model_id == SENTENCE_MODEL_ID:
+        return "minilm"
+    name = f"minilm:{model_id}"
+    if not registry.is_registered(name):
+        registry.register(name, lambda: SentenceTransformer(model_id))
+    return name
+
+def sentence_broker_name(model_id=SENTENCE_MODEL_ID):
+    """Broker entry encoding the transcripts of concurrent jobs in one call."""
+    name = sentence_model_name(model_id)
+    if not broker.is_registered(name):
+        broker.register(name, lambda texts: registry.get(name).encode(texts, batch_size=len(texts)))
+    return name
+
+# Reference-answer embeddings, shared by every candidate answering the same question
+answer_cache = EmbeddingCache()
+
+def compare(result , answers, question_id=None, model_id=SENTENCE_MODEL_ID):
     # if not os.path.exists(f"tmp/{filename}.txt"):
     #     return {"error": "File not found", "status_code": 404}
     
@@ -12,9 +39,31 @@ def compare(result , answers):
     # with open(f"tmp/pre-defined.txt", 'r') as text:
     #     text2 = text.read()
 
+    model = registry.get(sentence_model_name(model_id))
+
+    # Only the transcript needs encoding when the reference answer is cached
+    if question_id is not None:
+        answer_embedding = answer_cache.get(question_id, answers, model_id, model.encode)
+        if BROKER_ENABLED:
+            return (broker.infer(sentence_broker_name(model_id), result)@answer_embedding)
+        return (model.encode([result])[0]@answer_embedding)
+
     sentences = [result, answers]
 
-    model = SentenceTransformer('sentence-transformers/all-MiniLM-L12-v2')
     embeddings = model.encode(sentences)
 
     return (embeddings[0]@embeddings[1])
+
+def precompute_answer_embeddings(questions, batch_size=64, model_id=SENTENCE_MODEL_ID):
+    """
+    Encode the reference answers of many questions in batches and cache them.
+    questions is an iterable of question documents with '_id' and 'answer'.
+    """
+    items = [(str(question['_id']), question['answer']) for question in questions if question.get('answer')]
+    if not items:
+        return 0
+
+    model = registry.get(sentence_model_name(model_id))
+    vectors = model.encode([text for _, text in items], batch_size=batch_size)
+    answer_cache.put_many(items, model_id, vectors)
+    return len(items)
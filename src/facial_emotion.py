@@ -3,88 +3,287 @@ import cv2
 import numpy as np
 import dlib
 from imutils import face_utils
-from tensorflow.keras.models import load_model
 from scipy.ndimage import zoom
 import csv
 import time
 
-def facial_emotion(video_path):
+from utils.model_registry import registry
+from utils.inference_broker import broker, stacked, BROKER_ENABLED
+from src.inference_backend import load_backend
+
+FACIAL_MODEL_PATH = 'Models/video.h5'
+
+def load_facial_models():
+    """Load the emotion CNN, the dlib face detector and the landmark predictor."""
+    # Exported ONNX/TFLite model when EMOTION_BACKEND selects one, Keras otherwise
+    backend = load_backend(FACIAL_MODEL_PATH)
+    if backend is None:
+        # Only the keras backend loads TensorFlow
+        from tensorflow.keras.models import load_model
+        backend = load_model(FACIAL_MODEL_PATH, compile=False)
+    return {
+        "model": backend,
+        "face_detector": dlib.get_frontal_face_detector(),
+        "predictor_landmarks": dlib.shape_predictor("Models/face_landmarks.dat"),
+    }
+
+registry.register("facial", load_facial_models)
+
+# Number of face crops per forward pass
+FACIAL_BATCH_SIZE = int(os.getenv("FACIAL_BATCH_SIZE", "32"))
+
+def predict_faces(model, faces, batch_size=FACIAL_BATCH_SIZE):
+    """
+    Run the emotion CNN over a list of preprocessed (48, 48, 1) crops in
+    fixed-size batches. The last batch is zero-padded so every call has the
+    same shape and the model is not retraced. Returns an (n, n_classes) array.
+    """
+    outputs = []
+    for start in range(0, len(faces), batch_size):
+        batch = np.stack(faces[start:start + batch_size])
+        n = len(batch)
+        if n < batch_size:
+            batch = np.concatenate([batch, np.zeros((batch_size - n,) + batch.shape[1:], dtype=batch.dtype)])
+        outputs.append(np.asarray(model.predict_on_batch(batch))[:n])
+    return np.concatenate(outputs) if outputs else np.zeros((0, 0))
+
+# Face crops from concurrent jobs share forward passes through the broker
+broker.register("facial", stacked(lambda faces: predict_faces(registry.get("facial")["model"], faces)))
+
+# Frame sampling defaults (unset means analyse every frame)
+FACIAL_SAMPLE_FPS = float(os.getenv("FACIAL_SAMPLE_FPS", "0")) or None
+FACIAL_FRAME_STRIDE = int(os.getenv("FACIAL_FRAME_STRIDE", "0")) or None
+FACIAL_MAX_FRAMES = int(os.getenv("FACIAL_MAX_FRAMES", "0")) or None
+FACIAL_MAX_TIME = float(os.getenv("FACIAL_MAX_TIME", "0")) or None
+
+def sampling_stride(native_fps, frame_count, sample_fps=None, frame_stride=None, max_frames=None):
+    """
+    Number of decoded frames to advance between analysed frames.
+    sample_fps targets an analysis rate, frame_stride fixes the step and
+    max_frames spreads a frame budget over the whole video.
+    """
+    stride = 1
+    if frame_stride:
+        stride = max(stride, int(frame_stride))
+    if sample_fps and native_fps > 0:
+        stride = max(stride, int(round(native_fps / sample_fps)))
+    if max_frames and frame_count > 0:
+        stride = max(stride, int(np.ceil(frame_count / max_frames)))
+    return stride
+
+# Run full HOG detection every N analysed frames and track faces in between (1 disables tracking)
+FACIAL_DETECT_EVERY = int(os.getenv("FACIAL_DETECT_EVERY", "1"))
+# Peak-to-sidelobe ratio below which a track is considered lost
+FACIAL_TRACK_MIN_CONFIDENCE = float(os.getenv("FACIAL_TRACK_MIN_CONFIDENCE", "7.0"))
+
+class FaceTracker:
+    """
+    Locate faces with the dlib HOG detector every detect_every frames and carry
+    the boxes in between with dlib correlation trackers. A full detection is
+    forced as soon as any tracker's confidence drops below min_confidence.
+    """
+
+    def __init__(self, face_detector, detect_every=FACIAL_DETECT_EVERY, min_confidence=FACIAL_TRACK_MIN_CONFIDENCE, upsample=1):
+        self.face_detector = face_detector
+        self.detect_every = max(1, int(detect_every))
+        self.min_confidence = min_confidence
+        self.upsample = upsample
+        self.trackers = []
+        self.frames_since_detection = 0
+        self.detections = 0
+
+    def locate(self, gray):
+        """Return the face rectangles for this grayscale frame."""
+        if self.detect_every > 1 and self.trackers and self.frames_since_detection < self.detect_every:
+            rects = self._track(gray)
+            if rects is not None:
+                self.frames_since_detection += 1
+                return rects
+
+        rects = self.face_detector(gray, self.upsample)
+        self.detections += 1
+        self.frames_since_detection = 1
+        if self.detect_every > 1:
+            self.trackers = []
+            for rect in rects:
+                tracker = dlib.correlation_tracker()
+                tracker.start_track(gray, rect)
+                self.trackers.append(tracker)
+        return rects
+
+    def _track(self, gray):
+        # None means a track was lost and the caller should detect again
+        rects = []
+        for tracker in self.trackers:
+            if tracker.update(gray) < self.min_confidence:
+                return None
+            position = tracker.get_position()
+            left = max(0, int(position.left()))
+            top = max(0, int(position.top()))
+            right = min(gray.shape[1] - 1, int(position.right()))
+            bottom = min(gray.shape[0] - 1, int(position.bottom()))
+            if right <= left or bottom <= top:
+                return None
+            rects.append(dlib.rectangle(left, top, right, bottom))
+        return rects
+
+def capture_frames(video_capture, stride=1):
+    """Yield (timestamp, grayscale frame) from an open cv2.VideoCapture, every stride frames."""
+    native_fps = video_capture.get(cv2.CAP_PROP_FPS) or 30.0
+    frame_index = 0
+    while video_capture.isOpened():
+        ret, frame = video_capture.read()
+        if not ret:
+            break  # Exit if no frames are left
+
+        yield round(frame_index / native_fps, 3), cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+        # Skip ahead to the next sampled frame: grab() still decodes the frames in between,
+        # only their retrieval and colour conversion are skipped
+        skipped = 0
+        while skipped < stride - 1 and video_capture.grab():
+            skipped += 1
+        frame_index += 1 + skipped
+
+def preprocess_face(gray, rect, shape_x=48, shape_y=48):
+    """Crop a detected face and scale it to the model input: (48, 48, 1) floats in [0, 1]."""
+    (x, y, w, h) = face_utils.rect_to_bb(rect)
+    face = gray[y:y + h, x:x + w]
+    face = zoom(face, (shape_x / face.shape[0], shape_y / face.shape[1]))
+    face = face.astype(np.float32) / float(face.max())
+    return np.reshape(face.flatten(), (shape_x, shape_y, 1))
+
+def array_frames(frames, timestamps, stride=1):
+    """Yield (timestamp, grayscale frame) from pre-decoded frames, every stride frames."""
+    for index in range(0, len(frames), stride):
+        yield float(timestamps[index]), frames[index]
+
+def facial_emotion(video_path, batch_size=FACIAL_BATCH_SIZE, sample_fps=FACIAL_SAMPLE_FPS,
+                   frame_stride=FACIAL_FRAME_STRIDE, max_frames=FACIAL_MAX_FRAMES, max_time=FACIAL_MAX_TIME,
+                   detect_every=FACIAL_DETECT_EVERY, frames=None, frame_timestamps=None):
     """
     Process a video file to predict facial emotions.
     Returns a dictionary of predictions and associated probabilities.
+    Face crops are collected across frames and classified batch_size at a time.
+    Frames can be sampled by target fps, fixed stride or frame budget, and
+    analysis stops after max_time seconds of processing. The timestamps of the
+    sampled frames and of every prediction are included in the result.
+    With detect_every > 1 faces are detected every detect_every analysed
+    frames and tracked in between (see FaceTracker).
+    Grayscale frames already decoded by utils.media_decode can be passed as
+    frames/frame_timestamps instead of reading video_path with OpenCV.
     """
     # Initialize variables
     model = None
     face_detector = None
     predictor_landmarks = None
     predictions = []
+    timestamps = []
+    sampled_frames = []
     emotion_data = {}
 
-    # Load the model and other resources
+    # Load the model and other resources (resident after the first job)
     try:
-        model = load_model('Models/video.h5', compile=False)
-        face_detector = dlib.get_frontal_face_detector()
-        predictor_landmarks = dlib.shape_predictor("Models/face_landmarks.dat")
+        models = registry.get("facial")
+        model = models["model"]
+        face_detector = models["face_detector"]
+        predictor_landmarks = models["predictor_landmarks"]
     except Exception as e:
         return {"error": f"Failed to load model or face detector: {str(e)}"}
 
-    # Check if video exists
-    if not os.path.exists(video_path):
-        return {"error": f"Video file not found: {video_path}"}
-
-    video_capture = cv2.VideoCapture(video_path)
-
-    # Check if video opened successfully
-    if not video_capture.isOpened():
-        return {"error": "Could not open video file."}
+    video_capture = None
+    if frames is not None:
+        # Frames decoded upstream: derive the rate from their timestamps
+        frame_count = len(frames)
+        native_fps = (frame_count - 1) / frame_timestamps[-1] if frame_count > 1 and frame_timestamps[-1] > 0 else 30.0
+        stride = sampling_stride(native_fps, frame_count, sample_fps, frame_stride, max_frames)
+        frame_source = array_frames(frames, frame_timestamps, stride)
+    else:
+        # Check if video exists
+        if not os.path.exists(video_path):
+            return {"error": f"Video file not found: {video_path}"}
+
+        video_capture = cv2.VideoCapture(video_path)
+
+        # Check if video opened successfully
+        if not video_capture.isOpened():
+            return {"error": "Could not open video file."}
+
+        native_fps = video_capture.get(cv2.CAP_PROP_FPS) or 30.0
+        frame_count = int(video_capture.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+        stride = sampling_stride(native_fps, frame_count, sample_fps, frame_stride, max_frames)
+        frame_source = capture_frames(video_capture, stride)
 
     # Define input shape and classes
     shape_x, shape_y = 48, 48
     n_classes = 7
     emotion_data = {i: [] for i in range(n_classes)}
 
+    # Face detection, optionally with tracking between detections
+    face_tracker = FaceTracker(face_detector, detect_every)
+
     # Timer setup
-    max_time = 15
     start_time = time.time()
 
-    while video_capture.isOpened():
-        ret, frame = video_capture.read()
-        if not ret:
-            break  # Exit if no frames are left
-
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        rects = face_detector(gray, 1)
+    # Preprocessed crops (with their frame timestamp) waiting for the next forward pass
+    pending_faces = []
+
+    def flush_faces():
+        faces = [face for _, face in pending_faces]
+        if BROKER_ENABLED:
+            probabilities = broker.infer("facial", np.stack(faces))
+        else:
+            probabilities = predict_faces(model, faces, batch_size)
+        for (timestamp, _), prediction in zip(pending_faces, probabilities):
+            for i in range(n_classes):
+                emotion_data[i].append(prediction[i].astype(float))
+            predictions.append(np.argmax(prediction))
+            timestamps.append(timestamp)
+        pending_faces.clear()
+
+    for timestamp, gray in frame_source:
+        # Stop once the frame or time budget is spent
+        if max_frames and len(sampled_frames) >= max_frames:
+            break
+        if max_time and time.time() - start_time > max_time:
+            print(f"Facial analysis time budget of {max_time}s reached")
+            break
+
+        sampled_frames.append(timestamp)
+        rects = face_tracker.locate(gray)
 
         for rect in rects:
             # Get face coordinates and landmarks
             try:
-                (x, y, w, h) = face_utils.rect_to_bb(rect)
-                face = gray[y:y + h, x:x + w]
-
                 shape = predictor_landmarks(gray, rect)
                 shape = face_utils.shape_to_np(shape)
 
                 # Zoom and preprocess the face image
-                face = zoom(face, (shape_x / face.shape[0], shape_y / face.shape[1]))
-                face = face.astype(np.float32) / float(face.max())
-                face = np.reshape(face.flatten(), (1, shape_x, shape_y, 1))
-
-                # Make emotion prediction
-                prediction = model.predict(face)
-                for i in range(n_classes):
-                    emotion_data[i].append(prediction[0][i].astype(float))
-                predictions.append(np.argmax(prediction))
+                pending_faces.append((timestamp, preprocess_face(gray, rect, shape_x, shape_y)))
 
             except Exception as e:
                 print(f"Error processing face: {str(e)}")
                 continue  # Skip to the next face
 
-        # Save frames as images if needed (optional)
-        frame_filename = f"frames/frame_{int(time.time())}.jpg"
-        cv2.imwrite(frame_filename, frame)  # Save the frame as an image
+        # Make emotion predictions once a full batch is collected
+        if len(pending_faces) >= batch_size:
+            try:
+                flush_faces()
+            except Exception as e:
+                print(f"Error predicting faces: {str(e)}")
+                pending_faces.clear()
 
     # Release video capture
-    video_capture.release()
+    if video_capture is not None:
+        video_capture.release()
+    print(f"Ran face detection on {face_tracker.detections} of {len(sampled_frames)} analysed frames")
+
+    # Predict the remaining partial batch
+    if pending_faces:
+        try:
+            flush_faces()
+        except Exception as e:
+            print(f"Error predicting faces: {str(e)}")
 
     # Map predictions to emotion names
     emotion_mapping = {0: 'Angry', 1: 'Disgust', 2: 'Fear', 3: 'Happy', 4: 'Sad', 5: 'Surprise', 6: 'Neutral'}
@@ -93,7 +292,9 @@ def facial_emotion(video_path):
     # Prepare the response data
     all_predictions = {
         'predictions': predictions_names,
-        **{f'prob_{emotion_mapping[i]}': emotion_data[i] for i in range(n_classes)}
+        **{f'prob_{emotion_mapping[i]}': emotion_data[i] for i in range(n_classes)},
+        'timestamps': timestamps,
+        'sampled_frames': sampled_frames,
     }
 
     # Log predictions to a CSV file
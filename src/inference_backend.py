@@ -0,0 +1,174 @@
+import os
+import logging
+import threading
+import numpy as np
+
+# Which runtime executes the emotion models: keras, onnx or tflite
+EMOTION_BACKEND = os.getenv("EMOTION_BACKEND", "keras").lower()
+# Intra-op threads for the ONNX Runtime / TFLite interpreters (0 = runtime default)
+BACKEND_NUM_THREADS = int(os.getenv("BACKEND_NUM_THREADS", "0"))
+
+
+def tflite_interpreter():
+    """
+    The TFLite Interpreter class from the standalone runtime (ai-edge-litert or
+    tflite-runtime), falling back to full TensorFlow when neither is installed.
+    """
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+        return Interpreter
+    except ImportError:
+        pass
+    try:
+        from tflite_runtime.interpreter import Interpreter
+        return Interpreter
+    except ImportError:
+        pass
+
+    logging.warning("Neither ai-edge-litert nor tflite-runtime is installed, loading TensorFlow for the tflite backend")
+    import tensorflow as tf
+    return tf.lite.Interpreter
+
+
+class TFLiteBackend:
+    """
+    Run an exported .tflite model. The interpreter is not thread-safe, so calls are serialised.
+    Builtin-op models run on the standalone runtime without TensorFlow; models exported with
+    TF ops (Flex) only run on the TensorFlow interpreter, so use the onnx backend for those.
+    """
+
+    def __init__(self, model_path, num_threads=BACKEND_NUM_THREADS):
+        self.model_path = model_path
+        self._interpreter = tflite_interpreter()(model_path=model_path, num_threads=num_threads or None)
+        self._input = self._interpreter.get_input_details()[0]
+        self._output = self._interpreter.get_output_details()[0]
+        self._batch_size = None
+        self._lock = threading.Lock()
+
+    def predict_on_batch(self, x):
+        x = np.asarray(x, dtype=self._input['dtype'])
+        with self._lock:
+            if self._batch_size != len(x):
+                self._interpreter.resize_tensor_input(self._input['index'], x.shape)
+                self._interpreter.allocate_tensors()
+                self._batch_size = len(x)
+            self._interpreter.set_tensor(self._input['index'], x)
+            self._interpreter.invoke()
+            return np.array(self._interpreter.get_tensor(self._output['index']))
+
+
+class OnnxBackend:
+    """Run an exported .onnx model with ONNX Runtime on CPU (sessions are thread-safe)."""
+
+    def __init__(self, model_path, num_threads=BACKEND_NUM_THREADS):
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            raise ImportError("The onnx backend requires onnxruntime (pip install onnxruntime)")
+
+        options = ort.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.model_path = model_path
+        self._session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self._input_name = self._session.get_inputs()[0].name
+
+    def predict_on_batch(self, x):
+        return self._session.run(None, {self._input_name: np.asarray(x, dtype=np.float32)})[0]
+
+
+def backend_path(keras_path, backend):
+    """Default location of the exported model next to the Keras weights, e.g. Models/video.onnx."""
+    extension = {"onnx": ".onnx", "tflite": ".tflite"}[backend]
+    return os.path.splitext(keras_path)[0] + extension
+
+
+def load_backend(keras_path, backend=EMOTION_BACKEND, exported_path=None):
+    """
+    Load the exported counterpart of a Keras model for the given backend.
+    Returns None for the keras backend so callers keep their Keras model.
+    """
+    if backend == "keras":
+        return None
+    if backend not in ("onnx", "tflite"):
+        raise ValueError(f"Unknown emotion backend '{backend}'")
+
+    exported_path = exported_path or backend_path(keras_path, backend)
+    if not os.path.exists(exported_path):
+        raise FileNotFoundError(f"Exported model not found at {exported_path}, run export_models.py first")
+
+    if backend == "onnx":
+        return OnnxBackend(exported_path)
+    return TFLiteBackend(exported_path)
+
+
+def export_tflite(model, output_path, quantize=None):
+    """
+    Convert a Keras model to TFLite, optionally with fp16 or int8 (dynamic range) weights.
+    Returns whether the model needed TF ops (Flex), which only the TensorFlow interpreter runs.
+    """
+    import tensorflow as tf
+
+    def convert(supported_ops):
+        converter = tf.lite.TFLiteConverter.from_keras_model(model)
+        converter.target_spec.supported_ops = supported_ops
+        if quantize == "fp16":
+            converter.optimizations = [tf.lite.Optimize.DEFAULT]
+            converter.target_spec.supported_types = [tf.float16]
+        elif quantize == "int8":
+            converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        return converter.convert()
+
+    # Builtin ops only, so the standalone runtime can run the model without TensorFlow
+    flex = False
+    try:
+        exported = convert([tf.lite.OpsSet.TFLITE_BUILTINS])
+    except Exception as e:
+        # Some layers (e.g. non-fused LSTM variants) have no TFLite builtin
+        logging.warning("Builtin-only TFLite conversion failed, retrying with TF ops (needs TensorFlow at inference): %s", str(e))
+        exported = convert([tf.lite.OpsSet.TFLITE_BUILTINS, tf.lite.OpsSet.SELECT_TF_OPS])
+        flex = True
+
+    with open(output_path, "wb") as f:
+        f.write(exported)
+    return flex
+
+
+def export_onnx(model, output_path, input_shape, quantize=None, opset=13):
+    """Convert a Keras model to ONNX, optionally with fp16 weights or int8 dynamic quantisation."""
+    import tensorflow as tf
+    try:
+        import tf2onnx
+    except ImportError:
+        raise ImportError("ONNX export requires tf2onnx (pip install tf2onnx onnxruntime)")
+
+    signature = (tf.TensorSpec(input_shape, tf.float32, name="input"),)
+    tf2onnx.convert.from_keras(model, input_signature=signature, opset=opset, output_path=output_path)
+
+    if quantize == "int8":
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+
+        float_path = output_path + ".float"
+        os.replace(output_path, float_path)
+        quantize_dynamic(float_path, output_path, weight_type=QuantType.QInt8)
+        os.remove(float_path)
+    elif quantize == "fp16":
+        import onnx
+        from onnxconverter_common import float16
+
+        onnx_model = float16.convert_float_to_float16(onnx.load(output_path), keep_io_types=True)
+        onnx.save(onnx_model, output_path)
+    return output_path
+
+
+def check_parity(reference, backend, sample, atol=1e-2):
+    """
+    Compare backend outputs with the Keras reference on a sample batch.
+    Returns the max absolute difference, the top-1 agreement and whether the
+    difference is within atol.
+    """
+    expected = np.asarray(reference(sample))
+    actual = np.asarray(backend.predict_on_batch(sample))
+    max_abs_diff = float(np.max(np.abs(expected - actual)))
+    agreement = float(np.mean(np.argmax(expected, axis=-1) == np.argmax(actual, axis=-1)))
+    return {"max_abs_diff": max_abs_diff, "top1_agreement": agreement, "within_tolerance": max_abs_diff <= atol}
@@ -2,24 +2,46 @@
 import time
 import os
 import numpy as np
+import threading
+from functools import lru_cache
 
 ## Audio Preprocessing ##
-import pyaudio
 import wave
 import librosa
-from scipy.stats import zscore
 
 ## Time Distributed CNN ##
-import tensorflow as tf
-from tensorflow.keras import backend as K
-from tensorflow.keras.models import Model
-from tensorflow.keras.layers import Input, Dense, Dropout, Activation, TimeDistributed
-from tensorflow.keras.layers import Conv2D, MaxPooling2D, BatchNormalization, Flatten
-from tensorflow.keras.layers import LSTM
+# TensorFlow is imported by the Keras code paths only, so the ONNX backend (and builtin-op TFLite models on ai-edge-litert) never load it
+
+from utils.model_registry import registry
+from utils.inference_broker import broker, stacked, BROKER_ENABLED
+from src.inference_backend import load_backend
+from utils.vad import VAD_MIN_CHUNK_SPEECH
+
+# Compute the STFT once per file instead of once per overlapping chunk
+SER_FAST_MEL = os.getenv("SER_FAST_MEL", "false").lower() == "true"
+# Run the CNN once per unique mel window and only the LSTM head per chunk
+SER_CACHED_WINDOWS = os.getenv("SER_CACHED_WINDOWS", "false").lower() == "true"
+# Maximum number of samples per forward pass
+SER_BATCH_SIZE = int(os.getenv("SER_BATCH_SIZE", "64"))
+
+# Keras graph construction is not thread-safe, model calls are
+_build_lock = threading.Lock()
+
+
+@lru_cache(maxsize=8)
+def mel_filterbank(sr=16000, n_fft=512, n_mels=128, fmax=4000):
+    '''
+    Mel filterbank matrix, built once per parameter set
+    '''
+    return librosa.filters.mel(sr=sr, n_fft=n_fft, n_mels=n_mels, fmax=fmax)
 
 
 '''
 Speech Emotion Recognition
+
+One resident instance can serve many job threads at once: predictions go
+through tf.functions with fixed input signatures and nothing resets the
+global Keras session.
 '''
 class speechEmotionRecognition:
 
@@ -28,10 +50,26 @@ class speechEmotionRecognition:
     '''
     def __init__(self, subdir_model=None):
 
+        # Broker model name when forward passes are shared with other jobs
+        self.broker_name = None
+
+        # Split encoder/head, built on first use of the cached-window path
+        self._encoder = None
+        self._head = None
+        self._split_lock = threading.Lock()
+
         # Load prediction model
+        self._model = None
         if subdir_model is not None:
-            self._model = self.build_model()
-            self._model.load_weights(subdir_model)
+            # Exported ONNX/TFLite model when EMOTION_BACKEND selects one, Keras otherwise
+            backend = load_backend(subdir_model)
+            if backend is not None:
+                self._predict_fn = backend.predict_on_batch
+            else:
+                with _build_lock:
+                    self._model = self.build_model()
+                    self._model.load_weights(subdir_model)
+                self._predict_fn = self.compile_predict(self._model, (None, 5, 128, 128, 1))
 
         # Emotion encoding
         self._emotion = {0:'Angry', 1:'Disgust', 2:'Fear', 3:'Happy', 4:'Neutral', 5:'Sad', 6:'Surprise'}
@@ -41,6 +79,8 @@ class speechEmotionRecognition:
     Voice recording function
     '''
     def voice_recording(self, filename, duration=5, sample_rate=16000, chunk=1024, channels=1):
+        # Microphone capture only, servers analysing uploads do not need PortAudio
+        import pyaudio
 
         # Start the audio recording stream
         p = pyaudio.PyAudio()
@@ -95,7 +135,7 @@ class speechEmotionRecognition:
         mel_spect = np.abs(librosa.stft(y, n_fft=n_fft, window=window, win_length=win_length, hop_length=hop_length)) ** 2
 
         # Compute mel spectrogram
-        mel_spect = librosa.feature.melspectrogram(S=mel_spect, sr=sr, n_mels=n_mels, fmax=fmax)
+        mel_spect = mel_filterbank(sr, n_fft, n_mels, fmax) @ mel_spect
 
         # Compute log-mel spectrogram
         mel_spect = librosa.power_to_db(mel_spect, ref=np.max)
@@ -103,29 +143,95 @@ class speechEmotionRecognition:
         return np.asarray(mel_spect)
 
 
+    '''
+    Log-mel spectrograms of overlapping chunks from a single STFT
+
+    Equivalent to z-scoring each chunk and calling mel_spectrogram on it,
+    up to two differences:
+    - z-score scaling cancels out in power_to_db(ref=np.max), so only the
+      mean removal differs; the global mean is removed instead of each
+      chunk's mean, a DC offset that lands in the lowest 6 mel bands
+      (below ~110 Hz) and, through window sidelobes, in quiet bins;
+    - with center=True, each chunk's first and last n_fft // (2 * hop_length)
+      frames (2 of 384 by default) see the neighbouring audio instead of
+      the STFT edge padding.
+    Measured tolerance on noisy speech-like audio (tests/test_speech_emotion.py),
+    outside the edge frames and the lowest 6 bands: at most 0.2 dB on bins
+    above -60 dB and 1.5 dB on any bin; mean absolute difference over all
+    bins at most 0.15 dB. The lowest bands differ by up to ~27 dB in quiet
+    frames and the edge frames by up to ~53 dB. chunk_step must be a
+    multiple of hop_length so chunk frames line up with the global grid.
+    '''
+    def mel_spectrogram_chunks(self, y, chunk_step=16000, chunk_size=49100, sr=16000, n_fft=512, win_length=256, hop_length=128, window='hamming', n_mels=128, fmax=4000, selected=None):
+
+        # Mel power over the whole signal
+        mel_power = self.mel_power(y, sr, n_fft, win_length, hop_length, window, n_mels, fmax)
+
+        # Per-chunk frame windows on the global grid
+        nb_chunks = 1 + (len(y) - chunk_size) // chunk_step
+        frames_per_chunk = 1 + chunk_size // hop_length
+        frame_step = chunk_step // hop_length
+
+        # Only the selected chunks (all by default)
+        chunk_ids = np.arange(nb_chunks) if selected is None else np.asarray(selected)
+
+        mel_spect = np.empty((len(chunk_ids), n_mels, frames_per_chunk), dtype=np.float32)
+        for i, c in enumerate(chunk_ids):
+            start = c * frame_step
+            mel_spect[i] = librosa.power_to_db(mel_power[:, start:start + frames_per_chunk], ref=np.max)
+
+        return mel_spect
+
+
+    '''
+    Mel power spectrogram of the whole (mean-removed) signal
+    '''
+    def mel_power(self, y, sr=16000, n_fft=512, win_length=256, hop_length=128, window='hamming', n_mels=128, fmax=4000):
+
+        power = np.abs(librosa.stft(y - y.mean(), n_fft=n_fft, window=window, win_length=win_length, hop_length=hop_length)) ** 2
+
+        return mel_filterbank(sr, n_fft, n_mels, fmax) @ power
+
+
     '''
     Audio framing
+
+    Returns a strided view of y with shape (y.shape[0], nb_frames, y.shape[1], win_size),
+    without copying. Pass dtype (float16 by default) to get a downcast copy instead.
     '''
-    def frame(self, y, win_step=64, win_size=128):
+    def frame(self, y, win_step=64, win_size=128, dtype=np.float16):
+
+        # Sliding windows over the last axis, keeping every win_step-th one
+        frames = np.lib.stride_tricks.sliding_window_view(y, win_size, axis=2)[:, :, ::win_step]
 
-        # Number of frames
-        nb_frames = 1 + int((y.shape[2] - win_size) / win_step)
+        # (channels, rows, frames, win) -> (channels, frames, rows, win)
+        frames = frames.transpose(0, 2, 1, 3)
 
-        # Framming
-        frames = np.zeros((y.shape[0], nb_frames, y.shape[1], win_size)).astype(np.float16)
-        for t in range(nb_frames):
-            frames[:,t,:,:] = np.copy(y[:,:,(t * win_step):(t * win_step + win_size)]).astype(np.float16)
+        if dtype is not None:
+            frames = frames.astype(dtype)
 
         return frames
 
 
+    '''
+    Row-wise z-normalization (same as mapping scipy zscore over the rows)
+    '''
+    def zscore_chunks(self, chunks):
+
+        mean = chunks.mean(axis=-1, keepdims=True)
+        std = chunks.std(axis=-1, keepdims=True)
+
+        return (chunks - mean) / np.where(std == 0, 1, std)
+
+
     '''
     Time distributed Convolutional Neural Network model
     '''
     def build_model(self):
-
-        # Clear Keras session
-        K.clear_session()
+        from tensorflow.keras.models import Model
+        from tensorflow.keras.layers import Input, Dense, Dropout, Activation, TimeDistributed
+        from tensorflow.keras.layers import Conv2D, MaxPooling2D, BatchNormalization, Flatten
+        from tensorflow.keras.layers import LSTM
 
         # Define input
         input_y = Input(shape=(5, 128, 128, 1), name='Input_MELSPECT')
@@ -173,6 +279,136 @@ class speechEmotionRecognition:
         return model
 
 
+    '''
+    Split the loaded model into a per-window CNN encoder and an LSTM + Dense head
+
+    Both reuse the layers of self._model, so they share the weights loaded
+    from the hdf5 file.
+    '''
+    def build_split_model(self):
+        from tensorflow.keras.models import Model
+        from tensorflow.keras.layers import Input, TimeDistributed
+
+        # CNN encoder: the layers wrapped in TimeDistributed, applied to one window
+        input_window = Input(shape=(128, 128, 1), name='Input_WINDOW')
+        y = input_window
+        for layer in self._model.layers:
+            if isinstance(layer, TimeDistributed):
+                y = layer.layer(y)
+        encoder = Model(inputs=input_window, outputs=y)
+
+        # Head: LSTM over the 5 window embeddings, then the classifier
+        input_embeddings = Input(shape=(5, y.shape[-1]), name='Input_EMBEDDINGS')
+        h = self._model.get_layer('LSTM_1')(input_embeddings)
+        h = self._model.get_layer('FC')(h)
+        head = Model(inputs=input_embeddings, outputs=h)
+
+        return encoder, head
+
+
+    '''
+    Compiled inference function with a fixed input signature (no retracing per batch size)
+    '''
+    def compile_predict(self, model, input_shape):
+        import tensorflow as tf
+
+        @tf.function(input_signature=[tf.TensorSpec(input_shape, tf.float32)])
+        def predict(x):
+            return model(x, training=False)
+
+        return predict
+
+
+    '''
+    Run a compiled predict function over X in batches of at most batch_size
+    '''
+    def run_batches(self, predict_fn, X, batch_size=SER_BATCH_SIZE):
+
+        outputs = [np.asarray(predict_fn(np.asarray(X[start:start + batch_size], dtype=np.float32)))
+                   for start in range(0, len(X), batch_size)]
+
+        return np.concatenate(outputs)
+
+
+    '''
+    Chunk step rounded to a whole number of mel windows, so windows are shared between chunks
+    '''
+    def window_aligned_step(self, chunk_step, hop_length=128, win_step=64):
+
+        window_samples = hop_length * win_step
+
+        return max(1, int(round(chunk_step / window_samples))) * window_samples
+
+
+    '''
+    Emotion probabilities per chunk with cached window embeddings
+
+    Windows are taken from one mel power spectrogram of the whole signal on
+    a global grid, so overlapping chunks share them. The CNN encoder runs
+    once per unique window input (see cached_window_inputs) and only the
+    LSTM head runs per chunk. chunk_step must come from window_aligned_step.
+    '''
+    def predict_proba_cached(self, y, chunk_step=16384, chunk_size=49100, sr=16000, hop_length=128, win_step=64, win_size=128, batch_size=SER_BATCH_SIZE, selected=None):
+
+        # Build the split models once, even with concurrent callers
+        if self._encoder is None:
+            with self._split_lock, _build_lock:
+                if self._encoder is None:
+                    encoder, head = self.build_split_model()
+                    self._encode_fn = self.compile_predict(encoder, (None, 128, 128, 1))
+                    self._head_fn = self.compile_predict(head, (None, 5, encoder.output_shape[-1]))
+                    self._head = head
+                    self._encoder = encoder
+
+        # Encode every unique window input once
+        inputs, index = self.cached_window_inputs(y, chunk_step, chunk_size, sr, hop_length, win_step, win_size, selected)
+        embeddings = self.run_batches(self._encode_fn, inputs[..., np.newaxis], batch_size)
+
+        # Gather each chunk's window embeddings and run the head
+        return self.run_batches(self._head_fn, embeddings[index], batch_size)
+
+
+    '''
+    Encoder inputs of the cached-window path
+
+    Each chunk keeps its own dB reference (its loudest mel bin, values
+    clipped top_db below it) exactly like mel_spectrogram_chunks, so the
+    inputs equal that path's windows for the same chunk_step. A window is
+    encoded once per distinct reference among the chunks containing it;
+    neighbouring chunks usually share their loudest bin, and so their
+    windows. Returns the unique inputs (n, n_mels, win_size) and, per
+    chunk, the indices of its windows in them.
+    '''
+    def cached_window_inputs(self, y, chunk_step=16384, chunk_size=49100, sr=16000, hop_length=128, win_step=64, win_size=128, selected=None, amin=1e-10, top_db=80.0):
+
+        # Absolute log-mel power of the whole signal
+        log_power = 10.0 * np.log10(np.maximum(amin, self.mel_power(y, sr, hop_length=hop_length)))
+
+        # Window layout: each chunk covers windows_per_chunk windows, advancing window_stride per chunk
+        frames_per_chunk = 1 + chunk_size // hop_length
+        windows_per_chunk = 1 + (frames_per_chunk - win_size) // win_step
+        window_stride = chunk_step // (hop_length * win_step)
+        frame_step = chunk_step // hop_length
+        nb_chunks = 1 + (len(y) - chunk_size) // chunk_step
+        chunk_ids = np.arange(nb_chunks) if selected is None else np.asarray(selected)
+
+        # dB reference of each chunk, as power_to_db(ref=np.max) would use on the chunk alone
+        refs = np.array([log_power[:, c * frame_step:c * frame_step + frames_per_chunk].max() for c in chunk_ids])
+        ref_values, ref_ids = np.unique(refs, return_inverse=True)
+
+        # (window, reference) pairs used by the selected chunks
+        window_ids = chunk_ids[:, np.newaxis] * window_stride + np.arange(windows_per_chunk)
+        keys = window_ids * len(ref_values) + ref_ids.reshape(-1, 1)
+        needed, index = np.unique(keys, return_inverse=True)
+        index = index.reshape(len(chunk_ids), windows_per_chunk)
+
+        # Relative dB per pair, float16 like the per-chunk framing
+        windows = self.frame(log_power[np.newaxis], win_step, win_size, dtype=None)[0]
+        inputs = windows[needed // len(ref_values)] - ref_values[needed % len(ref_values)][:, np.newaxis, np.newaxis]
+
+        return np.maximum(inputs, -top_db).astype(np.float16), index
+
+
     '''
     Predict speech emotion over time from an audio file
     '''
@@ -181,43 +417,119 @@ class speechEmotionRecognition:
         # Read audio file
         y, sr = librosa.core.load(filename, sr=sample_rate, offset=0.5)
 
-        # Split audio signals into chunks
-        chunks = self.frame(y.reshape(1, 1, -1), chunk_step, chunk_size)
+        return self.predict_emotion_from_array(y, chunk_step, chunk_size, predict_proba, sample_rate, offset=0)
 
-        # Reshape chunks
-        chunks = chunks.reshape(chunks.shape[1],chunks.shape[-1])
+    '''
+    Predict speech emotion over time from decoded mono PCM samples
+    '''
+    def predict_emotion_from_array(self, y, chunk_step=16000, chunk_size=49100, predict_proba=False, sample_rate=16000, offset=0.5, fast_mel=SER_FAST_MEL, cached_windows=SER_CACHED_WINDOWS, speech_map=None, min_speech_ratio=VAD_MIN_CHUNK_SPEECH):
 
-        # Z-normalization
-        y = np.asarray(list(map(zscore, chunks)))
+        # Skip the leading offset like the file-based path
+        offset_samples = int(offset * sample_rate)
+        y = np.asarray(y, dtype=np.float32)[offset_samples:]
 
-        # Compute mel spectrogram
-        mel_spect = np.asarray(list(map(self.mel_spectrogram, y)))
+        # The split encoder/head needs the Keras model, exported backends use the full model
+        use_cached = cached_windows and self._model is not None
+        if use_cached:
+            # Chunk step snapped to the window grid
+            chunk_step = self.window_aligned_step(chunk_step)
+
+        # Skip chunks that are mostly silence according to the speech map
+        selected = self.speech_chunks(speech_map, len(y), chunk_step, chunk_size, offset_samples, min_speech_ratio)
+
+        if use_cached:
+
+            # Shared window embeddings
+            proba = self.predict_proba_cached(y, chunk_step, chunk_size, sr=sample_rate, selected=selected)
+
+        else:
+
+            proba = self.predict_proba_chunks(y, chunk_step, chunk_size, sample_rate, fast_mel, selected=selected)
+
+        # Predict emotion
+        if predict_proba is True:
+            predict = proba
+        else:
+            predict = np.argmax(proba, axis=1)
+            predict = [self._emotion.get(emotion) for emotion in predict]
+
+        # Predict timestamp
+        chunk_ids = np.arange(len(predict)) if selected is None else selected
+        timestamp = np.round((chunk_size + chunk_ids * chunk_step) / sample_rate)
+
+        return [predict, timestamp]
+
+    '''
+    Indices of the chunks with enough speech, or None to keep every chunk
+    '''
+    def speech_chunks(self, speech_map, n_samples, chunk_step, chunk_size, offset_samples=0, min_speech_ratio=VAD_MIN_CHUNK_SPEECH):
+
+        if speech_map is None:
+            return None
+
+        # Chunk positions in the samples of the full recording
+        nb_chunks = 1 + (n_samples - chunk_size) // chunk_step
+        if nb_chunks <= 0:
+            return None
+        ratios = speech_map.chunk_ratios(offset_samples + np.arange(nb_chunks) * chunk_step, chunk_size)
+
+        # Keep at least the most voiced chunk so short answers still get a result
+        selected = np.flatnonzero(ratios >= min_speech_ratio)
+        if len(selected) == 0:
+            selected = np.array([np.argmax(ratios)])
+
+        return selected
+
+    '''
+    Model inputs (n_chunks, 5, 128, 128, 1) for the overlapping chunks of a signal
+    '''
+    def chunk_inputs(self, y, chunk_step=16000, chunk_size=49100, sample_rate=16000, fast_mel=SER_FAST_MEL, selected=None):
+
+        if fast_mel and chunk_step % 128 == 0:
+
+            # Compute mel spectrograms from a single STFT over the signal
+            mel_spect = self.mel_spectrogram_chunks(y, chunk_step, chunk_size, sr=sample_rate, selected=selected)
+
+        else:
+
+            # Split audio signals into chunks (strided view, no copy)
+            chunks = self.frame(y.reshape(1, 1, -1), chunk_step, chunk_size, dtype=None)
+
+            # Reshape chunks
+            chunks = chunks.reshape(chunks.shape[1],chunks.shape[-1])
+
+            # Only the selected chunks
+            if selected is not None:
+                chunks = chunks[selected]
+
+            # Z-normalization
+            y = self.zscore_chunks(chunks)
+
+            # Compute mel spectrogram
+            mel_spect = np.asarray(list(map(self.mel_spectrogram, y)))
 
         # Time distributed Framing
         mel_spect_ts = self.frame(mel_spect)
 
         # Build X for time distributed CNN
-        X = mel_spect_ts.reshape(mel_spect_ts.shape[0],
+        return mel_spect_ts.reshape(mel_spect_ts.shape[0],
                                     mel_spect_ts.shape[1],
                                     mel_spect_ts.shape[2],
                                     mel_spect_ts.shape[3],
                                     1)
 
-        # Predict emotion
-        if predict_proba is True:
-            predict = self._model.predict(X)
-        else:
-            predict = np.argmax(self._model.predict(X), axis=1)
-            predict = [self._emotion.get(emotion) for emotion in predict]
+    '''
+    Emotion probabilities per overlapping chunk with the full time distributed model
+    '''
+    def predict_proba_chunks(self, y, chunk_step=16000, chunk_size=49100, sample_rate=16000, fast_mel=SER_FAST_MEL, selected=None):
 
-        # Clear Keras session
-        K.clear_session()
+        X = self.chunk_inputs(y, chunk_step, chunk_size, sample_rate, fast_mel, selected)
 
-        # Predict timestamp
-        timestamp = np.concatenate([[chunk_size], np.ones((len(predict) - 1)) * chunk_step]).cumsum()
-        timestamp = np.round(timestamp / sample_rate)
+        # Batched with the chunks of concurrent jobs
+        if self.broker_name is not None:
+            return broker.infer(self.broker_name, X)
 
-        return [predict, timestamp]
+        return self.run_batches(self._predict_fn, X)
 
     '''
     Export emotions predicted to csv format
@@ -231,3 +543,34 @@ class speechEmotionRecognition:
             for emotion in predictions:
                 f.write(str(emotion)+'\n')
             f.close()
+
+
+# Default weights for the speech emotion model
+SER_MODEL_PATH = os.path.join('Models', 'audio.hdf5')
+
+def load_speech_emotion_model():
+    SER = speechEmotionRecognition(SER_MODEL_PATH)
+    if BROKER_ENABLED:
+        SER.broker_name = "speech_emotion"
+    return SER
+
+registry.register("speech_emotion", load_speech_emotion_model)
+
+def predict_speech_emotions(audio, speech_map=None):
+    """
+    Emotion per chunk of an audio file path or decoded samples with the
+    resident model, and the emotion labels in model order.
+    """
+    SER = registry.get("speech_emotion")
+    if isinstance(audio, str):
+        emotions, _ = SER.predict_emotion_from_file(audio)
+    else:
+        emotions, _ = SER.predict_emotion_from_array(audio, speech_map=speech_map)
+    return emotions, list(SER._emotion.values())
+
+def predict_speech_emotion_batch(X):
+    SER = registry.get("speech_emotion")
+    return SER.run_batches(SER._predict_fn, X)
+
+# Chunks of concurrent jobs share forward passes of the resident model
+broker.register("speech_emotion", stacked(predict_speech_emotion_batch))
@@ -1,49 +1,240 @@
 import torch
 import os
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import transformers
 from transformers import AutoModelForSpeechSeq2Seq, AutoProcessor, pipeline
 
+from utils.model_registry import registry
+from utils.inference_broker import broker, BROKER_ENABLED
+
 # Ensure the directory for output text exists
 if not os.path.exists('tmp'):
     os.makedirs('tmp')
 
-def speech_to_text(audio_file_path):
+# Model ID
+WHISPER_MODEL_ID = "distil-whisper/distil-large-v3"
+
+# CPU-only options: int8 dynamic quantisation of the Linear layers and torch thread counts
+ASR_CPU_INT8 = os.getenv("ASR_CPU_INT8", "false").lower() == "true"
+ASR_TORCH_THREADS = int(os.getenv("ASR_TORCH_THREADS", "0"))
+ASR_TORCH_INTEROP_THREADS = int(os.getenv("ASR_TORCH_INTEROP_THREADS", "0"))
+ASR_QUANT_CACHE_DIR = os.getenv("ASR_QUANT_CACHE_DIR", os.path.join('Models', 'cache'))
+
+def configure_torch_threads(intra_op=ASR_TORCH_THREADS, inter_op=ASR_TORCH_INTEROP_THREADS):
+    """Pin torch's intra-op (and, before any parallel work, inter-op) thread pools."""
+    if intra_op:
+        torch.set_num_threads(intra_op)
+    if inter_op:
+        try:
+            torch.set_num_interop_threads(inter_op)
+        except RuntimeError:
+            # Can only be set once, before the inter-op pool starts
+            pass
+
+def quantized_checkpoint_path(model_id, cache_dir=ASR_QUANT_CACHE_DIR):
+    # The module is pickled, so the cache is only valid for the same torch/transformers versions
+    versions = f"torch{torch.__version__}-transformers{transformers.__version__}".replace('+', '_')
+    return os.path.join(cache_dir, f"{model_id.replace('/', '--')}-int8-{versions}.pt")
+
+def load_quantized_whisper(model_id=WHISPER_MODEL_ID, cache_dir=ASR_QUANT_CACHE_DIR):
+    """
+    Whisper with its nn.Linear layers dynamically quantised to int8 for CPU.
+    The quantised module is cached on disk so later startups skip both the
+    float32 load and the quantisation pass.
+    """
+    path = quantized_checkpoint_path(model_id, cache_dir)
+    if os.path.exists(path):
+        return torch.load(path, weights_only=False)
+
+    model = AutoModelForSpeechSeq2Seq.from_pretrained(
+        model_id, torch_dtype=torch.float32, low_cpu_mem_usage=True, use_safetensors=True
+    )
+    model.eval()
+    model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    torch.save(model, path + '.tmp')
+    os.replace(path + '.tmp', path)
+    return model
+
+def load_whisper_pipeline(model_id=WHISPER_MODEL_ID, cpu_int8=ASR_CPU_INT8):
+    """Load the Whisper model and processor and wrap them in an ASR pipeline."""
     # Set device and dtype
     device = "cuda:0" if torch.cuda.is_available() else "cpu"
     torch_dtype = torch.float16 if torch.cuda.is_available() else torch.float32
 
-    # Model ID
-    model_id = "distil-whisper/distil-large-v3"
+    if device == "cpu":
+        configure_torch_threads()
 
-    # Load model and processor
-    try:
+    if device == "cpu" and cpu_int8:
+        model = load_quantized_whisper(model_id)
+    else:
         model = AutoModelForSpeechSeq2Seq.from_pretrained(
             model_id, torch_dtype=torch_dtype, low_cpu_mem_usage=True, use_safetensors=True
         )
         model.to(device)
 
-        processor = AutoProcessor.from_pretrained(model_id)
-
-        # Create the speech recognition pipeline
-        pipe = pipeline(
-            "automatic-speech-recognition",
-            model=model,
-            tokenizer=processor.tokenizer,
-            feature_extractor=processor.feature_extractor,
-            max_new_tokens=128,
-            torch_dtype=torch_dtype,
-            device=device,
-        )
+    processor = AutoProcessor.from_pretrained(model_id)
+
+    # Create the speech recognition pipeline
+    return pipeline(
+        "automatic-speech-recognition",
+        model=model,
+        tokenizer=processor.tokenizer,
+        feature_extractor=processor.feature_extractor,
+        max_new_tokens=128,
+        torch_dtype=torch_dtype,
+        device=device,
+    )
+
+registry.register("whisper", load_whisper_pipeline)
+
+def whisper_model_name(model_id=WHISPER_MODEL_ID):
+    """Registry name of the ASR pipeline for model_id, registering other variants on first use."""
+    if model_id == WHISPER_MODEL_ID:
+        return "whisper"
+    name = f"whisper:{model_id}"
+    if not registry.is_registered(name):
+        registry.register(name, lambda: load_whisper_pipeline(model_id))
+    return name
+
+def whisper_broker_name(model_id=WHISPER_MODEL_ID):
+    """Broker entry batching short transcriptions of concurrent jobs through one pipeline call."""
+    name = whisper_model_name(model_id)
+    if not broker.is_registered(name):
+        broker.register(name, lambda inputs: registry.get(name)(inputs, batch_size=len(inputs), return_timestamps=True))
+    return name
+
+# Chunked long-form decoding: chunks are batched through the encoder/decoder and stitched on their strides
+ASR_CHUNKED = os.getenv("ASR_CHUNKED", "false").lower() == "true"
+ASR_CHUNK_LENGTH_S = float(os.getenv("ASR_CHUNK_LENGTH_S", "25"))
+ASR_STRIDE_LENGTH_S = float(os.getenv("ASR_STRIDE_LENGTH_S", "0")) or None
+ASR_BATCH_SIZE = int(os.getenv("ASR_BATCH_SIZE", "8"))
+# Shard long answers across this many worker processes (0 disables)
+ASR_PARALLEL_WORKERS = int(os.getenv("ASR_PARALLEL_WORKERS", "0"))
+ASR_SHARD_LENGTH_S = float(os.getenv("ASR_SHARD_LENGTH_S", "60"))
+
+def transcribe(pipe, audio, sample_rate=16000, chunked=ASR_CHUNKED, batch_size=ASR_BATCH_SIZE,
+               chunk_length_s=ASR_CHUNK_LENGTH_S, stride_length_s=ASR_STRIDE_LENGTH_S):
+    """Run the ASR pipeline and return its result with "text" and timestamped "chunks"."""
+    # Decoded samples are passed straight to the feature extractor (no ffmpeg call)
+    if isinstance(audio, np.ndarray):
+        audio = {"raw": np.asarray(audio, dtype=np.float32), "sampling_rate": sample_rate}
+
+    if chunked:
+        return pipe(audio, return_timestamps=True, chunk_length_s=chunk_length_s,
+                    stride_length_s=stride_length_s, batch_size=batch_size)
+    return pipe(audio, return_timestamps=True)  # Enable timestamps for long audio
+
+def split_on_quiet(audio, shard_length_s=ASR_SHARD_LENGTH_S, sample_rate=16000, search_s=2.0, frame_s=0.02):
+    """
+    Split samples into shards of about shard_length_s, moving each cut to the
+    quietest 20 ms frame within search_s of the target so words are not cut.
+    Returns a list of (start, end) sample indices.
+    """
+    shard = int(shard_length_s * sample_rate)
+    search = int(search_s * sample_rate)
+    frame = int(frame_s * sample_rate)
+
+    bounds = [0]
+    target = shard
+    while target < len(audio) - shard // 4:
+        lo, hi = max(bounds[-1] + frame, target - search), min(len(audio), target + search)
+        window = audio[lo:hi][: (hi - lo) // frame * frame].reshape(-1, frame)
+        cut = lo + int(np.argmin(np.sqrt((window ** 2).mean(axis=1)))) * frame + frame // 2 if len(window) else target
+        bounds.append(cut)
+        target = cut + shard
+    bounds.append(len(audio))
+    return list(zip(bounds[:-1], bounds[1:]))
+
+# Per-process state of the parallel transcription pool
+_worker_pipe = None
+_parallel_pool = None
+_parallel_pool_lock = threading.Lock()
+
+def _init_parallel_worker(model_id, threads):
+    global _worker_pipe
+    configure_torch_threads(threads)
+    _worker_pipe = load_whisper_pipeline(model_id)
+
+def _transcribe_shard(audio, offset_s, sample_rate, chunked):
+    result = transcribe(_worker_pipe, audio, sample_rate, chunked)
+    chunks = []
+    for chunk in result.get("chunks", []):
+        start, end = chunk["timestamp"]
+        chunks.append({
+            "text": chunk["text"],
+            "timestamp": (None if start is None else round(start + offset_s, 2), None if end is None else round(end + offset_s, 2)),
+        })
+    return {"text": result["text"], "chunks": chunks}
+
+def parallel_pool(workers=ASR_PARALLEL_WORKERS, model_id=WHISPER_MODEL_ID):
+    """Process pool where every worker loads Whisper once and gets an equal share of the cores."""
+    global _parallel_pool
+    with _parallel_pool_lock:
+        if _parallel_pool is None:
+            threads = max(1, (os.cpu_count() or 1) // workers)
+            _parallel_pool = ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_parallel_worker, initargs=(model_id, threads)
+            )
+        return _parallel_pool
+
+def transcribe_parallel(audio, sample_rate=16000, workers=ASR_PARALLEL_WORKERS, shard_length_s=ASR_SHARD_LENGTH_S, chunked=ASR_CHUNKED):
+    """Shard the samples at quiet points, transcribe shards on the process pool and stitch them in order."""
+    audio = np.asarray(audio, dtype=np.float32)
+    pool = parallel_pool(workers)
+    futures = [
+        pool.submit(_transcribe_shard, audio[start:end], start / sample_rate, sample_rate, chunked)
+        for start, end in split_on_quiet(audio, shard_length_s, sample_rate)
+    ]
+    results = [future.result() for future in futures]
+    return {
+        "text": " ".join(result["text"].strip() for result in results if result["text"].strip()),
+        "chunks": [chunk for result in results for chunk in result["chunks"]],
+    }
+
+def speech_to_text(audio_file_path, sample_rate=16000, speech_map=None, model_id=WHISPER_MODEL_ID):
+    """
+    Transcribe an audio file path or an array of mono PCM samples at sample_rate.
+    With a speech_map only the voiced regions of the array are decoded.
+    model_id selects the Whisper variant (see utils.tiers).
+    """
+    audio = audio_file_path
+
+    # Drop silence before decoding
+    if speech_map is not None and isinstance(audio, np.ndarray):
+        if not speech_map.has_speech:
+            return "", None
+        audio = speech_map.voiced_audio(audio)
+
+    # Long answers are sharded across worker processes (which hold the default model)
+    if ASR_PARALLEL_WORKERS and model_id == WHISPER_MODEL_ID and isinstance(audio, np.ndarray) and len(audio) > ASR_SHARD_LENGTH_S * sample_rate * 1.25:
+        try:
+            return transcribe_parallel(audio, sample_rate)["text"], None
+        except Exception as e:
+            return None, f"Failed to transcribe audio: {str(e)}"
+
+    # Load model and processor (resident after the first job)
+    try:
+        pipe = registry.get(whisper_model_name(model_id))
     except Exception as e:
         return None, f"Failed to load model or processor: {str(e)}"
 
     # Transcribe audio
     try:
-        result = pipe(audio_file_path, return_timestamps=True)  # Enable timestamps for long audio
+        if BROKER_ENABLED and not ASR_CHUNKED and isinstance(audio, np.ndarray) and len(audio) <= 30 * sample_rate:
+            # Answers that fit one Whisper window are batched with other jobs
+            result = broker.infer(whisper_broker_name(model_id), {"raw": np.asarray(audio, dtype=np.float32), "sampling_rate": sample_rate})
+        else:
+            result = transcribe(pipe, audio, sample_rate)
         return result["text"], None
     except Exception as e:
         return None, f"Failed to transcribe audio: {str(e)}"
 
-
 # def speech_to_text(audio_file_path):
 #     # Set device and dtype
 #     device = "cuda:0" if torch.cuda.is_available() else "cpu"
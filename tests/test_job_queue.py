@@ -0,0 +1,113 @@
+from datetime import timedelta
+
+import mongomock
+import pytest
+
+from utils.job_queue import JobQueue, utcnow
+
+
+@pytest.fixture
+def collection():
+    return mongomock.MongoClient().db.jobs
+
+
+def make_queue(collection, **kwargs):
+    kwargs.setdefault("lease_seconds", 60)
+    kwargs.setdefault("max_attempts", 3)
+    kwargs.setdefault("retry_delay_seconds", 30)
+    return JobQueue(collection, **kwargs)
+
+
+def expire_lease(collection, job):
+    collection.update_one({"_id": job["_id"]}, {"$set": {"lease_expires_at": utcnow() - timedelta(seconds=1)}})
+
+
+def test_claim_is_exclusive_between_owners(collection):
+    queue = make_queue(collection)
+    job_id = queue.enqueue("process_video", {"videoUrl": "u"})
+
+    job = queue.claim(owner="a")
+    assert job["_id"] == job_id
+    assert job["lease_owner"] == "a"
+    assert job["attempts"] == 1
+    assert queue.claim(owner="b") is None
+
+
+def test_expired_lease_is_dispatched_again(collection):
+    queue = make_queue(collection)
+    queue.enqueue("process_video", {})
+    first = queue.claim(owner="a")
+    assert queue.claim(owner="b") is None
+
+    expire_lease(collection, first)
+    second = queue.claim(owner="b")
+    assert second["_id"] == first["_id"]
+    assert second["lease_owner"] == "b"
+    assert second["attempts"] == 2
+
+
+def test_heartbeat_fails_after_the_lease_is_lost(collection):
+    queue = make_queue(collection)
+    queue.enqueue("process_video", {})
+    first = queue.claim(owner="a")
+    assert queue.heartbeat(first, owner="a")
+
+    expire_lease(collection, first)
+    second = queue.claim(owner="b")
+
+    assert not queue.heartbeat(first, owner="a")
+    assert not queue.complete(first, owner="a")
+    assert queue.heartbeat(second, owner="b")
+    assert queue.complete(second, owner="b")
+    assert collection.find_one({"_id": first["_id"]})["status"] == "done"
+
+
+def test_failed_attempt_is_retried_after_a_delay(collection):
+    queue = make_queue(collection)
+    queue.enqueue("process_video", {})
+    job = queue.claim(owner="a")
+
+    before = utcnow()
+    assert queue.fail(job, "boom", owner="a") == "queued"
+    stored = collection.find_one({"_id": job["_id"]})
+    assert stored["error"] == "boom"
+    assert stored["lease_owner"] is None
+    assert stored["available_at"] >= before + timedelta(seconds=29)
+
+    # Not claimable until the delay has passed
+    assert queue.claim(owner="a") is None
+    collection.update_one({"_id": job["_id"]}, {"$set": {"available_at": utcnow() - timedelta(seconds=1)}})
+    retried = queue.claim(owner="a")
+    assert retried["attempts"] == 2
+
+
+def test_job_fails_for_good_after_max_attempts(collection):
+    queue = make_queue(collection, max_attempts=2, retry_delay_seconds=0)
+    queue.enqueue("process_video", {})
+
+    assert queue.fail(queue.claim(owner="a"), "first", owner="a") == "queued"
+    assert queue.fail(queue.claim(owner="a"), "second", owner="a") == "failed"
+    assert queue.claim(owner="a") is None
+    assert queue.stats() == {"queued": 0, "running": 0, "done": 0, "failed": 1}
+
+
+def test_fail_expired_fails_abandoned_last_attempts(collection):
+    queue = make_queue(collection, max_attempts=1)
+    queue.enqueue("process_video", {"interviewId": "i"})
+    job = queue.claim(owner="a")
+    assert queue.fail_expired() == []
+
+    expire_lease(collection, job)
+    # Out of attempts: not dispatched again, failed instead
+    assert queue.claim(owner="b") is None
+    failed = queue.fail_expired()
+    assert [failed_job["_id"] for failed_job in failed] == [job["_id"]]
+    assert failed[0]["status"] == "failed"
+    assert failed[0]["payload"] == {"interviewId": "i"}
+    assert queue.fail_expired() == []
+
+
+def test_default_owner_follows_the_current_process(collection, monkeypatch):
+    queue = JobQueue(collection)
+    monkeypatch.setattr("os.getpid", lambda: 4242)
+    assert queue.owner.endswith(":4242")
@@ -0,0 +1,72 @@
+import io
+
+import numpy as np
+import pytest
+
+from utils import media_decode
+from utils.media_decode import MediaDecoder
+
+
+class Pipe(io.BytesIO):
+    def close(self):
+        # Bytes ffmpeg would still be blocked writing
+        self.unread = len(self.getvalue()) - self.tell()
+        super().close()
+
+
+class FakeProcess:
+    """Stands in for the ffmpeg process, streaming numbered grayscale frames on stdout."""
+
+    def __init__(self, n_frames, frame_bytes):
+        data = b''.join(bytes([i % 256]) * frame_bytes for i in range(n_frames))
+        self.stdout = Pipe(data)
+        self.stderr = io.BytesIO()
+
+    def kill(self):
+        pass
+
+    def wait(self):
+        return 0
+
+
+def decoder(monkeypatch, n_frames, duration, fps=5, max_frames=100):
+    info = {"width": 64, "height": 36, "fps": 30.0, "duration": duration, "has_audio": False}
+    monkeypatch.setattr(media_decode, "probe_media", lambda path: info)
+    decoder = MediaDecoder("video.mp4", width=64, fps=fps, max_frames=max_frames)
+    monkeypatch.setattr(decoder, "_start", lambda: setattr(decoder, "_process", FakeProcess(n_frames, decoder.frame_bytes)))
+    return decoder
+
+
+def test_long_recordings_are_decoded_at_a_lower_rate(monkeypatch):
+    # 60 s at 5 fps would be 300 frames, the cap allows 100
+    d = decoder(monkeypatch, n_frames=100, duration=60.0)
+    assert d.fps == pytest.approx(100 / 60)
+
+    frames, timestamps, audio = d.decode()
+    assert frames.shape == (100, 36, 64)
+    assert timestamps[-1] == pytest.approx(99 / d.fps, abs=1e-3)
+
+
+def test_native_rate_is_capped(monkeypatch):
+    d = decoder(monkeypatch, n_frames=100, duration=10.0, fps=None)
+    assert d.fps == pytest.approx(10.0)
+
+
+def test_frames_past_the_cap_are_dropped(monkeypatch):
+    # Container under-reports the duration, so more frames arrive than were planned for
+    d = decoder(monkeypatch, n_frames=250, duration=2.0)
+    frames, timestamps, audio = d.decode()
+
+    assert len(frames) == len(timestamps) == 100
+    assert [frame[0, 0] for frame in frames[-2:]] == [98, 99]
+    # Every frame was read, so ffmpeg is not left blocked on the pipe
+    assert d._process.stdout.unread == 0
+
+
+def test_short_recordings_keep_the_requested_rate(monkeypatch):
+    d = decoder(monkeypatch, n_frames=50, duration=10.0)
+    frames, timestamps, audio = d.decode()
+
+    assert d.fps == 5
+    assert len(frames) == 50
+    assert len(audio) == 0
@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+from src.speech_emotion1 import speechEmotionRecognition
+
+SR = 16000
+
+
+@pytest.fixture
+def ser():
+    # No weights: only the signal processing is exercised
+    return speechEmotionRecognition()
+
+
+def speech_like(seconds=12, seed=0):
+    """Voiced bursts with a rising level, so every chunk has a different loudest bin."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(SR * seconds) / SR
+    envelope = (np.sin(2 * np.pi * 0.7 * t) > 0) * np.linspace(0.2, 1, len(t))
+    return (envelope * (0.3 * np.sin(2 * np.pi * 220 * t) + 0.1 * rng.standard_normal(len(t)))).astype(np.float32)
+
+
+def test_cached_window_inputs_keep_the_per_chunk_reference(ser):
+    y = speech_like()
+    chunk_step = ser.window_aligned_step(16000)
+
+    inputs, index = ser.cached_window_inputs(y, chunk_step)
+    per_chunk = ser.frame(ser.mel_spectrogram_chunks(y, chunk_step, sr=SR))
+
+    assert inputs[index].shape == per_chunk.shape
+    assert np.abs(inputs[index].astype(np.float32) - per_chunk.astype(np.float32)).max() == 0
+
+
+def test_cached_window_inputs_share_windows_between_chunks(ser):
+    # A 250 Hz tone repeats every 64 samples, so every chunk has the same loudest bin
+    y = (0.5 * np.sin(2 * np.pi * 250 * np.arange(SR * 12) / SR)).astype(np.float32)
+    inputs, index = ser.cached_window_inputs(y, ser.window_aligned_step(16000))
+
+    assert len(inputs) < index.size
+
+
+def test_cached_window_inputs_only_cover_selected_chunks(ser):
+    y = speech_like()
+    chunk_step = ser.window_aligned_step(16000)
+    selected = np.array([1, 4])
+
+    inputs, index = ser.cached_window_inputs(y, chunk_step, selected=selected)
+    per_chunk = ser.frame(ser.mel_spectrogram_chunks(y, chunk_step, sr=SR, selected=selected))
+
+    assert np.array_equal(inputs[index], per_chunk)
+
+
+def per_chunk_reference(ser, y, chunk_step=16000, chunk_size=49100):
+    """The original path: z-score every chunk, then one STFT per chunk."""
+    chunks = ser.frame(y.reshape(1, 1, -1), chunk_step, chunk_size, dtype=None).reshape(-1, chunk_size)
+    return np.asarray([ser.mel_spectrogram(chunk) for chunk in ser.zscore_chunks(chunks)])
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_mel_spectrogram_chunks_tolerance(ser, seed):
+    # Recordings always have some background noise
+    y = speech_like(seed=seed) + np.float32(1e-3) * np.random.default_rng(seed).standard_normal(SR * 12).astype(np.float32)
+
+    fast = ser.mel_spectrogram_chunks(y, 16000, sr=SR)
+    reference = per_chunk_reference(ser, y)
+    assert fast.shape == reference.shape
+    difference = np.abs(fast - reference)
+
+    # Away from the 2 edge frames per side and the 6 bands below ~110 Hz (DC offset of the mean removal)
+    inner = (slice(None), slice(6, None), slice(2, -2))
+    assert difference[inner][reference[inner] > -60].max() <= 0.2
+    assert difference[inner].max() <= 1.5
+    assert difference.mean() <= 0.15
@@ -0,0 +1,15 @@
+import pytest
+
+from utils.tiers import DEFAULT_TIER, resolve_tier
+
+
+def test_names_are_normalised():
+    assert resolve_tier("Fast") == "fast"
+    assert resolve_tier(None) == DEFAULT_TIER
+    assert resolve_tier("") == DEFAULT_TIER
+
+
+@pytest.mark.parametrize("tier", ["turbo", 1, ["fast"], {"name": "fast"}, True])
+def test_invalid_tiers_raise_value_error(tier):
+    with pytest.raises(ValueError):
+        resolve_tier(tier)
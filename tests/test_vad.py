@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+from utils.vad import detect_speech
+
+SR = 16000
+
+
+def voiced(seconds, level_db=-20.0, seed=0):
+    """Harmonic, syllable-modulated signal at about level_db dBFS, with no pauses."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(SR * seconds)) / SR
+    pitch = 140 + 20 * np.sin(2 * np.pi * 0.5 * t)
+    phase = 2 * np.pi * np.cumsum(pitch) / SR
+    signal = sum(np.sin(k * phase) / k for k in range(1, 6))
+    # Syllable rate loudness changes that never drop to silence
+    signal *= 0.6 + 0.4 * np.abs(np.sin(2 * np.pi * 2.5 * t))
+    signal += 0.05 * rng.standard_normal(len(t))
+    rms = np.sqrt(np.mean(signal ** 2))
+    return (signal / rms * 10 ** (level_db / 20)).astype(np.float32)
+
+
+def noise(seconds, level_db=-70.0, seed=1):
+    return (10 ** (level_db / 20) * np.random.default_rng(seed).standard_normal(int(SR * seconds))).astype(np.float32)
+
+
+def test_pause_free_speech_is_speech():
+    speech_map = detect_speech(voiced(8))
+
+    assert speech_map.has_speech
+    assert speech_map.speech_seconds >= 0.9 * 8
+
+
+@pytest.mark.parametrize("level_db", [-35.0, -40.0, -42.0, -45.0])
+def test_quiet_pause_free_speech_is_kept(level_db):
+    speech_map = detect_speech(voiced(8, level_db=level_db))
+
+    assert speech_map.speech_seconds >= 0.9 * 8
+
+
+def test_background_noise_is_not_speech():
+    assert not detect_speech(noise(5)).has_speech
+    assert not detect_speech(np.zeros(SR * 5, dtype=np.float32)).has_speech
+
+
+def test_audio_that_cannot_be_segmented_falls_back_to_the_whole_recording():
+    # Audible, but too close to its own floor for the relative threshold
+    speech_map = detect_speech(noise(5, level_db=-55.0))
+
+    assert speech_map.fallback
+    assert speech_map.segments == [(0, SR * 5)]
+
+
+def test_speech_between_pauses_is_segmented():
+    audio = np.concatenate([noise(2), voiced(3) + noise(3), noise(2)])
+    speech_map = detect_speech(audio)
+
+    assert not speech_map.fallback
+    assert len(speech_map.segments) == 1
+    start, end = speech_map.segments[0]
+    assert abs(start / SR - 2) < 0.3
+    assert abs(end / SR - 5) < 0.3
@@ -0,0 +1,183 @@
+import os
+import logging
+
+from utils.executor import stage_config_from_env
+
+# Give each analyzer an explicit share of the cores instead of letting every runtime size its pools to the host
+CPU_BUDGET_ENABLED = os.getenv("CPU_BUDGET", "false").lower() == "true"
+# Also pin stage threads (or stage pool processes) to their cores
+CPU_BUDGET_AFFINITY = os.getenv("CPU_BUDGET_AFFINITY", "false").lower() == "true"
+# Number of cores to share between the analyzers (0 = every core this process may run on)
+CPU_BUDGET_CORES = int(os.getenv("CPU_BUDGET_CORES", "0"))
+# CPU_BUDGET_PROCESSES (processes running analyzers on this host, e.g. gunicorn workers) and
+# CPU_BUDGET_SLOT (this process's index) are read on use: gunicorn.conf.py sets them around the fork
+# Relative share of the cores per analyzer stage
+CPU_BUDGET_WEIGHTS = os.getenv("CPU_BUDGET_WEIGHTS", "transcript:2,facial:1,speech_emotion:1")
+
+# Runtimes whose thread pools each analyzer stage uses
+STAGE_RUNTIMES = {
+    "facial": ("tensorflow", "opencv"),
+    "speech_emotion": ("tensorflow",),
+    "transcript": ("torch",),
+}
+
+# Environment variables read by BLAS / OpenMP when they are first loaded
+NATIVE_THREAD_ENV = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS", "NUMEXPR_NUM_THREADS")
+
+
+def available_cores(limit=CPU_BUDGET_CORES):
+    try:
+        cores = sorted(os.sched_getaffinity(0))
+    except AttributeError:
+        cores = list(range(os.cpu_count() or 1))
+    return cores[:limit] if limit else cores
+
+
+def process_cores(cores=None, processes=None, slot=None):
+    """
+    This process's share of the host: a disjoint 1/processes slice of the
+    cores, so N gunicorn workers planning their own budgets do not
+    oversubscribe the host N times.
+    """
+    cores = cores or available_cores()
+    processes = max(1, processes or int(os.getenv("CPU_BUDGET_PROCESSES", "1")))
+    slot = int(os.getenv("CPU_BUDGET_SLOT", "0")) if slot is None else slot
+    size = max(1, len(cores) // processes)
+    start = (slot % processes) * size
+    return [cores[(start + k) % len(cores)] for k in range(size)]
+
+
+def parse_weights(text=CPU_BUDGET_WEIGHTS):
+    weights = {}
+    for item in text.split(","):
+        if item.strip():
+            stage, weight = item.split(":")
+            weights[stage.strip()] = float(weight)
+    return weights
+
+
+def plan_budget(cores=None, config=None, weights=None):
+    """
+    Split the cores (this process's slice by default) between the analyzer stages by weight. Returns
+    {stage: {"cores": [...], "workers": n, "threads": t}} where t is the
+    thread budget of each of the stage's n concurrent workers. Cores are
+    handed out as contiguous slices; with fewer cores than stages the
+    slices wrap around and stages share cores.
+    """
+    cores = cores or process_cores()
+    config = config or stage_config_from_env()
+    weights = weights or parse_weights()
+    stages = [stage for stage in STAGE_RUNTIMES if weights.get(stage, 0) > 0]
+    total = sum(weights[stage] for stage in stages)
+
+    plan = {}
+    start = 0
+    for i, stage in enumerate(stages):
+        # The last stage takes the remainder so every core is used
+        if i == len(stages) - 1:
+            count = len(cores) - start
+        else:
+            count = int(round(len(cores) * weights[stage] / total))
+        count = max(1, count)
+        workers = max(1, config.get(stage, (1, 0))[0])
+        stage_cores = [cores[(start + k) % len(cores)] for k in range(count)]
+        plan[stage] = {"cores": stage_cores, "workers": workers, "threads": max(1, count // workers)}
+        start += count
+    return plan
+
+
+def worker_cores(plan, stage, index):
+    """Cores of one stage worker: its own slice of the stage's cores, or all of them when they run out."""
+    budget = plan[stage]
+    threads = budget["threads"]
+    cores = budget["cores"][index * threads:(index + 1) * threads]
+    return cores or budget["cores"]
+
+
+def limit_native_threads_env(plan=None):
+    """
+    Cap BLAS / OpenMP pools (numpy, librosa, scipy) to the smallest stage
+    budget. Only effective before numpy is first imported, so gunicorn.conf.py
+    calls it; variables that are already set are left alone.
+    """
+    plan = plan or plan_budget()
+    threads = str(min(budget["threads"] for budget in plan.values()))
+    for name in NATIVE_THREAD_ENV:
+        os.environ.setdefault(name, threads)
+
+
+def configure_runtimes(tensorflow=None, torch=None, opencv=None, inter_op=1):
+    """Size the TensorFlow, PyTorch and OpenCV thread pools of this process (None leaves one alone)."""
+    if tensorflow:
+        try:
+            import tensorflow as tf
+            tf.config.threading.set_intra_op_parallelism_threads(tensorflow)
+            tf.config.threading.set_inter_op_parallelism_threads(inter_op)
+        except (ImportError, RuntimeError) as e:
+            # TensorFlow only accepts this before its runtime starts
+            logging.warning("Could not set TensorFlow threads: %s", str(e))
+    if torch:
+        try:
+            import torch as torch_module
+            torch_module.set_num_threads(torch)
+            try:
+                torch_module.set_num_interop_threads(inter_op)
+            except RuntimeError:
+                # Can only be set once, before the inter-op pool starts
+                pass
+        except ImportError:
+            pass
+    if opencv:
+        try:
+            import cv2
+            cv2.setNumThreads(opencv)
+        except ImportError:
+            pass
+
+
+def runtime_threads(plan, stages):
+    """Per-runtime thread counts for the given stages: the largest worker budget among the stages using it."""
+    threads = {}
+    for stage in stages:
+        for runtime in STAGE_RUNTIMES[stage]:
+            threads[runtime] = max(threads.get(runtime, 0), plan[stage]["threads"])
+    return threads
+
+
+def pin_current_thread(cores):
+    """Restrict the calling thread (Linux) to cores; threads it starts later inherit the mask."""
+    try:
+        os.sched_setaffinity(0, cores)
+    except (AttributeError, OSError) as e:
+        logging.warning("Could not set CPU affinity: %s", str(e))
+
+
+def install(executor, plan=None, affinity=CPU_BUDGET_AFFINITY):
+    """
+    Apply the budget when every analyzer shares this process (thread mode):
+    size the runtime pools and optionally pin each stage worker thread to
+    its cores. Runtime pools are shared and inherit the mask of the thread
+    that starts them, so process mode gives stricter isolation. Must run
+    before the models are loaded.
+    """
+    plan = plan or plan_budget()
+    configure_runtimes(**runtime_threads(plan, plan))
+    if affinity:
+        def pin_stage_thread(stage, index):
+            # Planned again in the thread: under gunicorn install runs in the master, before the worker has its slot
+            current = plan_budget()
+            if stage in current:
+                pin_current_thread(worker_cores(current, stage, index))
+        executor.set_initializer(pin_stage_thread)
+    logging.info("CPU budget: %s", {stage: {"cores": budget["cores"], "threads": budget["threads"]} for stage, budget in plan.items()})
+    return plan
+
+
+def configure_stage_process(stage, plan=None, affinity=CPU_BUDGET_AFFINITY):
+    """Apply one stage's budget to a process that only runs that stage (process mode pool initializer)."""
+    plan = plan or plan_budget()
+    if stage not in plan:
+        return
+    configure_runtimes(**runtime_threads(plan, [stage]))
+    if affinity:
+        pin_current_thread(plan[stage]["cores"])
@@ -0,0 +1,221 @@
+import logging
+import threading
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+
+
+class SkipStage(Exception):
+    """Raised by a stage that has nothing to do; its dependents are skipped with the same reason."""
+
+    def __init__(self, reason):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class Stage:
+    """
+    One step of a pipeline. fn(context, **inputs) returns a dict with the
+    declared outputs. Stages with an executor_stage run on that executor
+    stage, the others run inline on the thread that makes them ready.
+    field names the result this stage reports (see the run listener).
+    """
+
+    def __init__(self, name, fn, inputs=(), outputs=(), executor_stage=None, field=None):
+        self.name = name
+        self.fn = fn
+        self.inputs = tuple(inputs)
+        self.outputs = tuple(outputs)
+        self.executor_stage = executor_stage
+        self.field = field
+
+
+class Pipeline:
+    """
+    Declarative DAG of stages connected by named artifacts. Artifacts that
+    no stage produces are the pipeline inputs. release maps an artifact
+    name to a cleanup function called once no remaining stage needs it.
+    """
+
+    def __init__(self, stages, release=None):
+        self.stages = list(stages)
+        self.release = release or {}
+
+        producers = {}
+        for stage in self.stages:
+            for output in stage.outputs:
+                if output in producers:
+                    raise ValueError(f"Artifact '{output}' is produced by both '{producers[output]}' and '{stage.name}'")
+                producers[output] = stage.name
+        self.inputs = sorted({name for stage in self.stages for name in stage.inputs} - set(producers))
+
+        # Kahn's algorithm, only to reject cycles
+        available = set(self.inputs)
+        remaining = list(self.stages)
+        while remaining:
+            ready = [stage for stage in remaining if all(name in available for name in stage.inputs)]
+            if not ready:
+                raise ValueError(f"Stages {[stage.name for stage in remaining]} form a cycle")
+            for stage in ready:
+                available.update(stage.outputs)
+                remaining.remove(stage)
+
+    def select(self, names):
+        """Sub-pipeline with only the named stages; outputs of the others become its inputs."""
+        return Pipeline([stage for stage in self.stages if stage.name in names], self.release)
+
+    def start(self, executor, context, artifacts, listener=None, block=True):
+        """
+        Run the pipeline on executor and return its PipelineRun without waiting.
+        listener(context, stage, record, outputs) is called when a stage
+        starts and when it ends. With block=False a full executor stage
+        raises QueueFullError for the first stages instead of waiting.
+        """
+        missing = set(self.inputs) - set(artifacts)
+        if missing:
+            raise ValueError(f"Missing pipeline inputs: {sorted(missing)}")
+        return PipelineRun(self, executor, context, artifacts, listener).start(block)
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+class PipelineRun:
+    """State of one pipeline execution: artifacts, per-stage records and completion."""
+
+    def __init__(self, pipeline, executor, context, artifacts, listener=None):
+        self.pipeline = pipeline
+        self.executor = executor
+        self.context = context
+        self.listener = listener
+        self.artifacts = dict(artifacts)
+        self.records = {stage.name: {"status": "pending", "started_at": None, "finished_at": None, "error": None, "reason": None}
+                        for stage in pipeline.stages}
+        self._available = set(self.artifacts)
+        self._consumers = Counter(name for stage in pipeline.stages for name in stage.inputs)
+        self._stages_using = defaultdict(list)
+        for stage in pipeline.stages:
+            for name in stage.inputs:
+                self._stages_using[name].append(stage)
+        self._remaining = len(pipeline.stages)
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+
+    def start(self, block=True):
+        if self._remaining == 0:
+            self._done.set()
+        else:
+            self._launch_ready(block)
+        return self
+
+    def wait(self, timeout=None):
+        """Wait for every stage to end and return the stage records."""
+        self._done.wait(timeout)
+        return self.records
+
+    def failed(self):
+        """Stages that failed, or were skipped because something upstream failed."""
+        return [name for name, record in self.records.items()
+                if record["status"] == "failed" or (record["status"] == "skipped" and record["reason"] == "failed")]
+
+    def _launch_ready(self, block=True):
+        with self._lock:
+            ready = [stage for stage in self.pipeline.stages
+                     if self.records[stage.name]["status"] == "pending" and all(name in self._available for name in stage.inputs)]
+            launches = []
+            for stage in ready:
+                self.records[stage.name]["status"] = "queued"
+                launches.append((stage, {name: self.artifacts[name] for name in stage.inputs}))
+
+        for stage, inputs in launches:
+            if stage.executor_stage is None:
+                self._execute(stage, inputs)
+            else:
+                self.executor.submit(stage.executor_stage, self._execute, stage, inputs, block=block)
+
+    def _notify(self, stage, outputs=None):
+        if self.listener is None:
+            return
+        try:
+            self.listener(self.context, stage, dict(self.records[stage.name]), outputs)
+        except Exception as e:
+            logging.error("Pipeline listener failed for stage '%s': %s", stage.name, str(e))
+
+    def _execute(self, stage, inputs):
+        with self._lock:
+            self.records[stage.name].update(status="running", started_at=_now())
+        self._notify(stage)
+
+        try:
+            outputs = stage.fn(self.context, **inputs) or {}
+            missing = set(stage.outputs) - set(outputs)
+            if missing:
+                raise ValueError(f"Stage '{stage.name}' did not return {sorted(missing)}")
+        except SkipStage as e:
+            self._finish(stage, "skipped", reason=e.reason)
+        except Exception as e:
+            logging.error("Stage '%s' failed: %s", stage.name, str(e))
+            self._finish(stage, "failed", error=str(e))
+        else:
+            self._finish(stage, "success", outputs=outputs)
+        finally:
+            # Executor threads keep their last arguments around, drop the artifacts now
+            inputs.clear()
+
+    def _dependents(self, stage):
+        """Pending stages that can no longer run because stage produced nothing."""
+        blocked, missing, changed = [], set(stage.outputs), True
+        while changed:
+            changed = False
+            for candidate in self.pipeline.stages:
+                if candidate not in blocked and self.records[candidate.name]["status"] == "pending" and missing & set(candidate.inputs):
+                    blocked.append(candidate)
+                    missing.update(candidate.outputs)
+                    changed = True
+        return blocked
+
+    def _finish(self, stage, status, outputs=None, error=None, reason=None):
+        now = _now()
+        with self._lock:
+            self.records[stage.name].update(status=status, finished_at=now, error=error, reason=reason)
+            consumed = list(stage.inputs)
+            skipped = []
+
+            if status == "success":
+                for name in stage.outputs:
+                    self.artifacts[name] = outputs[name]
+                    self._available.add(name)
+            else:
+                # Nothing downstream can run; failures reach dependents as "failed", skips keep their reason
+                for dependent in self._dependents(stage):
+                    self.records[dependent.name].update(status="skipped", finished_at=now, reason=reason if status == "skipped" else "failed")
+                    consumed.extend(dependent.inputs)
+                    skipped.append(dependent)
+
+            self._remaining -= 1 + len(skipped)
+
+            # Free artifacts no remaining stage needs
+            released = []
+            for name in consumed:
+                self._consumers[name] -= 1
+                if self._consumers[name] == 0 and name in self.artifacts:
+                    released.append((name, self.artifacts.pop(name)))
+            done = self._remaining == 0
+
+        for name, value in released:
+            cleanup = self.pipeline.release.get(name)
+            if cleanup is not None:
+                try:
+                    cleanup(value)
+                except Exception as e:
+                    logging.warning("Could not release artifact '%s': %s", name, str(e))
+        del released
+
+        self._notify(stage, outputs)
+        for dependent in skipped:
+            self._notify(dependent)
+
+        if done:
+            self._done.set()
+        else:
+            self._launch_ready()
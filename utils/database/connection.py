@@ -0,0 +1,59 @@
+import os
+import threading
+
+from pymongo import MongoClient
+
+
+class MongoConnection:
+    """
+    MongoClient created lazily by the process that uses it. pymongo clients
+    are not fork-safe, so a client inherited from a parent process (e.g. the
+    gunicorn master with preload_app) is replaced on first use in the child,
+    or explicitly through reset() in a post_fork hook.
+    """
+
+    def __init__(self, uri=None, db_name=None):
+        self.uri = uri
+        self.db_name = db_name
+        self._client = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def configure(self, uri, db_name):
+        self.uri = uri
+        self.db_name = db_name
+
+    def client(self):
+        if self._client is None or self._pid != os.getpid():
+            with self._lock:
+                if self._client is None or self._pid != os.getpid():
+                    self._client = MongoClient(self.uri or os.getenv("MONGO_URI"))
+                    self._pid = os.getpid()
+        return self._client
+
+    def db(self):
+        return self.client()[self.db_name or os.getenv("MONGO_DB_NAME")]
+
+    def collection(self, name):
+        return LazyCollection(self, name)
+
+    def reset(self):
+        """Forget the current client (without closing the parent's sockets) so the next use connects again."""
+        self._lock = threading.Lock()
+        self._client = None
+        self._pid = None
+
+
+class LazyCollection:
+    """Stand-in for a pymongo Collection that resolves it on the current process's client."""
+
+    def __init__(self, connection, name):
+        self._connection = connection
+        self._name = name
+
+    def __getattr__(self, attr):
+        return getattr(self._connection.db()[self._name], attr)
+
+
+# Connection shared by the app module and its background jobs
+mongo = MongoConnection()
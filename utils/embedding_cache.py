@@ -0,0 +1,116 @@
+import os
+import re
+import hashlib
+import threading
+import logging
+from collections import OrderedDict
+
+import numpy as np
+from bson.objectid import ObjectId
+
+# Number of reference-answer embeddings kept in memory
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "2048"))
+# Store embeddings on the question documents so other workers can reuse them (writes to the questions collection)
+EMBEDDING_CACHE_PERSIST = os.getenv("EMBEDDING_CACHE_PERSIST", "false").lower() == "true"
+
+
+def text_hash(text):
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Embeddings of reference answers keyed by questionId, answer hash and model.
+    Lookups go to an in-process LRU first, then (optionally) to the vector
+    stored on the question document, and only then to the encoder. Each
+    model has its own stored slot (answerEmbeddings.<model>), so tiers
+    using different encoders do not overwrite each other.
+    """
+
+    def __init__(self, max_entries=EMBEDDING_CACHE_SIZE, collection=None, field="answerEmbeddings", persist=EMBEDDING_CACHE_PERSIST):
+        self.max_entries = max_entries
+        self.collection = collection
+        self.field = field
+        self.persist = persist
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def attach(self, collection):
+        """Use the questions collection for persistence."""
+        self.collection = collection
+
+    def _key(self, question_id, text, model_id):
+        return (str(question_id), text_hash(text), model_id)
+
+    def _slot(self, model_id):
+        # Mongo field names cannot contain "." or start with "$"
+        return re.sub(r"[.$]", "_", model_id)
+
+    def _remember(self, key, vector):
+        with self._lock:
+            self._entries[key] = vector
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _load(self, question_id, answer_hash, model_id):
+        # Stored vector is only valid for the same answer text and model
+        if not (self.persist and self.collection is not None):
+            return None
+        slot = self._slot(model_id)
+        try:
+            document = self.collection.find_one({'_id': ObjectId(question_id)}, {f"{self.field}.{slot}": 1})
+        except Exception as e:
+            logging.warning("Could not read cached embedding for %s: %s", question_id, str(e))
+            return None
+        stored = ((document or {}).get(self.field) or {}).get(slot)
+        if stored and stored.get('hash') == answer_hash and stored.get('model') == model_id:
+            return np.asarray(stored['vector'], dtype=np.float32)
+        return None
+
+    def _store(self, question_id, answer_hash, model_id, vector):
+        if not (self.persist and self.collection is not None):
+            return
+        try:
+            self.collection.update_one(
+                {'_id': ObjectId(question_id)},
+                {'$set': {f"{self.field}.{self._slot(model_id)}": {'hash': answer_hash, 'model': model_id, 'vector': vector.tolist()}}}
+            )
+        except Exception as e:
+            logging.warning("Could not persist embedding for %s: %s", question_id, str(e))
+
+    def get(self, question_id, text, model_id, encode):
+        """Return the embedding of text, calling encode([text]) only on a full miss."""
+        key = self._key(question_id, text, model_id)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+
+        vector = self._load(question_id, key[1], model_id)
+        if vector is None:
+            with self._lock:
+                self.misses += 1
+            vector = np.asarray(encode([text])[0], dtype=np.float32)
+            self._store(question_id, key[1], model_id, vector)
+        else:
+            with self._lock:
+                self.hits += 1
+
+        self._remember(key, vector)
+        return vector
+
+    def put_many(self, items, model_id, vectors):
+        """Cache precomputed vectors for (question_id, text) items."""
+        for (question_id, text), vector in zip(items, vectors):
+            vector = np.asarray(vector, dtype=np.float32)
+            key = self._key(question_id, text, model_id)
+            self._store(question_id, key[1], model_id, vector)
+            self._remember(key, vector)
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,161 @@
+import os
+import math
+import time
+import queue
+import threading
+import logging
+from collections import deque
+from concurrent.futures import Future
+
+# Default (workers, queue size) for each pipeline stage
+DEFAULT_STAGES = {
+    "video": (2, 20),
+    "facial": (1, 20),
+    "speech_emotion": (1, 20),
+    "transcript": (1, 20),
+    "comparison": (2, 50),
+}
+
+
+class QueueFullError(Exception):
+    """Raised when a stage queue has no room for another job."""
+
+    def __init__(self, stage, retry_after):
+        super().__init__(f"Queue for stage '{stage}' is full")
+        self.stage = stage
+        self.retry_after = retry_after
+
+
+def stage_config_from_env(stages=DEFAULT_STAGES):
+    """
+    Read per-stage concurrency from the environment, e.g.
+    EXECUTOR_FACIAL_WORKERS=2 and EXECUTOR_FACIAL_QUEUE=10.
+    """
+    config = {}
+    for stage, (workers, queue_size) in stages.items():
+        prefix = f"EXECUTOR_{stage.upper()}"
+        config[stage] = (
+            int(os.getenv(f"{prefix}_WORKERS", workers)),
+            int(os.getenv(f"{prefix}_QUEUE", queue_size)),
+        )
+    return config
+
+
+class _StageQueue:
+    """Bounded queue and fixed worker pool for a single stage type."""
+
+    def __init__(self, name, workers, queue_size, initializer=None):
+        self.name = name
+        self.workers = max(1, workers)
+        self.initializer = initializer
+        self.queue = queue.Queue(maxsize=max(1, queue_size))
+        self.active = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.wait_times = deque(maxlen=100)
+        self.run_times = deque(maxlen=100)
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def start(self):
+        # Threads are started lazily so the executor can be created before a fork
+        with self._lock:
+            self._threads = [t for t in self._threads if t.is_alive()]
+            for i in range(self.workers - len(self._threads)):
+                thread = threading.Thread(target=self._worker, args=(len(self._threads),), name=f"{self.name}-worker", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def retry_after(self):
+        """Seconds a rejected client should wait before resubmitting."""
+        with self._lock:
+            avg_run = sum(self.run_times) / len(self.run_times) if self.run_times else 30
+        backlog = self.queue.qsize() + self.active
+        return max(1, math.ceil(avg_run * backlog / self.workers))
+
+    def _worker(self, index=0):
+        if self.initializer is not None:
+            try:
+                self.initializer(self.name, index)
+            except Exception as e:
+                logging.warning("Initializer for stage '%s' worker %d failed: %s", self.name, index, str(e))
+
+        while True:
+            future, fn, args, kwargs, enqueued_at = self.queue.get()
+            if not future.set_running_or_notify_cancel():
+                self.queue.task_done()
+                continue
+
+            started_at = time.monotonic()
+            with self._lock:
+                self.active += 1
+                self.wait_times.append(started_at - enqueued_at)
+            try:
+                future.set_result(fn(*args, **kwargs))
+                with self._lock:
+                    self.completed += 1
+            except BaseException as e:
+                logging.error("Stage '%s' task failed: %s", self.name, str(e))
+                future.set_exception(e)
+                with self._lock:
+                    self.failed += 1
+            finally:
+                with self._lock:
+                    self.active -= 1
+                    self.run_times.append(time.monotonic() - started_at)
+                self.queue.task_done()
+
+    def stats(self):
+        with self._lock:
+            waits = list(self.wait_times)
+            return {
+                "workers": self.workers,
+                "queue_size": self.queue.maxsize,
+                "queue_depth": self.queue.qsize(),
+                "active": self.active,
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "avg_wait_s": round(sum(waits) / len(waits), 3) if waits else 0.0,
+                "max_wait_s": round(max(waits), 3) if waits else 0.0,
+            }
+
+
+class StageExecutor:
+    """
+    Bounded executor with a separate queue and worker pool per stage type.
+    Entry points submit without blocking and get a QueueFullError when the
+    stage is saturated; internal fan-out blocks to apply back-pressure.
+    """
+
+    def __init__(self, config=None, initializer=None):
+        config = config or stage_config_from_env()
+        self._stages = {name: _StageQueue(name, workers, size, initializer) for name, (workers, size) in config.items()}
+
+    def set_initializer(self, initializer):
+        """Call initializer(stage, index) at the start of every worker thread started from now on."""
+        for stage_queue in self._stages.values():
+            stage_queue.initializer = initializer
+
+    def submit(self, stage, fn, *args, block=False, **kwargs):
+        """Queue fn(*args, **kwargs) on a stage and return a Future."""
+        stage_queue = self._stages[stage]
+        stage_queue.start()
+
+        future = Future()
+        item = (future, fn, args, kwargs, time.monotonic())
+        try:
+            stage_queue.queue.put(item, block=block)
+        except queue.Full:
+            with stage_queue._lock:
+                stage_queue.rejected += 1
+            raise QueueFullError(stage, stage_queue.retry_after())
+        return future
+
+    def stats(self):
+        return {name: stage_queue.stats() for name, stage_queue in self._stages.items()}
+
+
+# Shared executor for the analysis pipeline in this process
+executor = StageExecutor()
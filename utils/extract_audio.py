@@ -1,5 +1,9 @@
 import os
 import subprocess
+import numpy as np
+
+# Sample rate expected by both Whisper and the speech emotion model
+AUDIO_SAMPLE_RATE = 16000
 
 # def extract_audio(video_path):
 #     # Create the audio filename in the recorded_audio directory
@@ -44,3 +48,31 @@ def extract_audio(video_path):
     except Exception as e:
         # print("error exc ", str(e))
         return {"error": f"An unexpected error occurred: {str(e)}"}
+
+def decode_audio(video_path, sample_rate=AUDIO_SAMPLE_RATE, mmap_path=None):
+    """
+    Decode the audio track once to mono float32 PCM at sample_rate.
+    ffmpeg writes raw samples to a pipe, so there is no intermediate
+    encode. If mmap_path is given the samples are also stored as a .npy
+    file and returned as a read-only memory map.
+    """
+    command = [
+        'ffmpeg', '-nostdin', '-loglevel', 'error', '-i', video_path,
+        '-map', 'a:0', '-vn', '-ac', '1', '-ar', str(sample_rate),
+        '-f', 'f32le', '-acodec', 'pcm_f32le', 'pipe:1'
+    ]
+    try:
+        result = subprocess.run(command, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        audio = np.frombuffer(result.stdout, dtype=np.float32)
+        if audio.size == 0:
+            return {"error": "Audio extraction produced no samples"}
+
+        if mmap_path is not None:
+            os.makedirs(os.path.dirname(mmap_path) or '.', exist_ok=True)
+            np.save(mmap_path, audio)
+            return np.load(mmap_path, mmap_mode='r')
+        return audio
+    except subprocess.CalledProcessError as e:
+        return {"error": f"Audio extraction failed: {e.stderr.decode(errors='ignore').strip() or str(e)}"}
+    except Exception as e:
+        return {"error": f"An unexpected error occurred: {str(e)}"}
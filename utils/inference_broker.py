@@ -0,0 +1,168 @@
+import os
+import time
+import queue
+import threading
+import logging
+from collections import deque
+from concurrent.futures import Future
+
+import numpy as np
+
+# Group model calls from concurrent jobs into shared batches
+BROKER_ENABLED = os.getenv("INFERENCE_BROKER", "false").lower() == "true"
+# Defaults for every model, overridable per model e.g. BROKER_FACIAL_MAX_BATCH=8
+BROKER_MAX_BATCH = int(os.getenv("BROKER_MAX_BATCH", "16"))
+BROKER_MAX_WAIT_MS = float(os.getenv("BROKER_MAX_WAIT_MS", "10"))
+
+
+def batch_config_from_env(name, max_batch_size=None, max_wait_ms=None):
+    """
+    Batch limits for a model, e.g. BROKER_WHISPER_MAX_BATCH=4 and
+    BROKER_WHISPER_MAX_WAIT_MS=20. Tier variants ("whisper:<id>") share
+    the settings of their base name.
+    """
+    prefix = f"BROKER_{name.split(':')[0].upper()}"
+    if max_batch_size is None:
+        max_batch_size = int(os.getenv(f"{prefix}_MAX_BATCH", BROKER_MAX_BATCH))
+    if max_wait_ms is None:
+        max_wait_ms = float(os.getenv(f"{prefix}_MAX_WAIT_MS", BROKER_MAX_WAIT_MS))
+    return max(1, max_batch_size), max(0.0, max_wait_ms)
+
+
+def stacked(predict):
+    """
+    batch_fn for array requests with a leading row axis: the rows of all
+    requests go through predict as one array and are split back per request.
+    """
+    def batch_fn(items):
+        sizes = [len(item) for item in items]
+        outputs = np.asarray(predict(np.concatenate(items)))
+        return np.split(outputs, np.cumsum(sizes)[:-1])
+    return batch_fn
+
+
+class _ModelQueue:
+    """Request queue and dispatcher thread for one model."""
+
+    def __init__(self, name, batch_fn, max_batch_size, max_wait_ms):
+        self.name = name
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.queue = queue.Queue()
+        self.requests = 0
+        self.batches = 0
+        self.failed = 0
+        self.batch_sizes = deque(maxlen=200)
+        self.wait_times = deque(maxlen=200)
+        self.run_times = deque(maxlen=200)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        # Started lazily so the broker can be created before a fork
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._dispatch, name=f"{self.name}-broker", daemon=True)
+                self._thread.start()
+
+    def _collect(self):
+        """Block for one request, then take more until the batch is full or the oldest one waited max_wait."""
+        batch = [self.queue.get()]
+        deadline = batch[0][2] + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _dispatch(self):
+        while True:
+            batch = [(item, future, enqueued_at) for item, future, enqueued_at in self._collect()
+                     if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+
+            started_at = time.monotonic()
+            try:
+                outputs = self.batch_fn([item for item, _, _ in batch])
+                if len(outputs) != len(batch):
+                    raise ValueError(f"Batch function for '{self.name}' returned {len(outputs)} results for {len(batch)} requests")
+                for (_, future, _), output in zip(batch, outputs):
+                    future.set_result(output)
+            except BaseException as e:
+                logging.error("Batched inference for '%s' failed: %s", self.name, str(e))
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                with self._lock:
+                    self.failed += 1
+            finally:
+                with self._lock:
+                    self.batches += 1
+                    self.batch_sizes.append(len(batch))
+                    self.wait_times.extend(started_at - enqueued_at for _, _, enqueued_at in batch)
+                    self.run_times.append(time.monotonic() - started_at)
+
+    def stats(self):
+        with self._lock:
+            sizes, waits, runs = list(self.batch_sizes), list(self.wait_times), list(self.run_times)
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": round(self.max_wait * 1000, 1),
+                "queue_depth": self.queue.qsize(),
+                "requests": self.requests,
+                "batches": self.batches,
+                "failed": self.failed,
+                "avg_batch_size": round(sum(sizes) / len(sizes), 2) if sizes else 0.0,
+                "largest_batch": max(sizes) if sizes else 0,
+                "avg_wait_ms": round(1000 * sum(waits) / len(waits), 2) if waits else 0.0,
+                "max_wait_ms_seen": round(1000 * max(waits), 2) if waits else 0.0,
+                "avg_batch_ms": round(1000 * sum(runs) / len(runs), 2) if runs else 0.0,
+            }
+
+
+class InferenceBroker:
+    """
+    In-process micro-batching for model calls from concurrent jobs. Jobs
+    submit single requests and get a Future back; a dispatcher thread per
+    model groups waiting requests into one batch_fn(items) call, bounded by
+    max_batch_size requests and max_wait_ms from the oldest request.
+    batch_fn must return one result per item, in order.
+    """
+
+    def __init__(self):
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, batch_fn, max_batch_size=None, max_wait_ms=None):
+        """Register batch_fn for a model name. Registering an existing name is a no-op."""
+        with self._lock:
+            if name not in self._models:
+                self._models[name] = _ModelQueue(name, batch_fn, *batch_config_from_env(name, max_batch_size, max_wait_ms))
+
+    def is_registered(self, name):
+        return name in self._models
+
+    def submit(self, name, item):
+        """Queue one request for a model and return a Future with its result."""
+        model_queue = self._models[name]
+        model_queue.start()
+
+        future = Future()
+        with model_queue._lock:
+            model_queue.requests += 1
+        model_queue.queue.put((item, future, time.monotonic()))
+        return future
+
+    def infer(self, name, item):
+        """Submit one request and wait for its result."""
+        return self.submit(name, item).result()
+
+    def stats(self):
+        return {name: model_queue.stats() for name, model_queue in self._models.items()}
+
+
+# Shared broker for the models in this process
+broker = InferenceBroker()
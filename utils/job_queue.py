@@ -0,0 +1,216 @@
+import os
+import socket
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+
+from pymongo import ASCENDING, ReturnDocument
+
+# Durable job intake: process-video enqueues into the jobs collection and workers claim jobs with leases
+JOB_QUEUE_ENABLED = os.getenv("JOB_QUEUE", "false").lower() == "true"
+# Claiming threads per process (0 = only enqueue, e.g. web nodes in front of job_worker.py nodes)
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "1"))
+# A lease not renewed for this long is considered abandoned and the job is dispatched again
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "120"))
+JOB_HEARTBEAT_SECONDS = int(os.getenv("JOB_HEARTBEAT_SECONDS", "30"))
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "2"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+# Delay before a failed job is retried, multiplied by the attempt number
+JOB_RETRY_DELAY_SECONDS = int(os.getenv("JOB_RETRY_DELAY_SECONDS", "30"))
+
+
+def utcnow():
+    # Naive UTC, like the datetimes pymongo returns
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class JobQueue:
+    """
+    Job queue stored in a Mongo collection (pymongo or mongomock). A job is
+    queued, then running under a lease owned by one worker, then done or
+    failed. Claims are atomic find_one_and_update calls, so any number of
+    processes and nodes can share the queue. Running jobs whose lease
+    expired are claimed again until max_attempts is reached.
+    """
+
+    def __init__(self, collection, lease_seconds=JOB_LEASE_SECONDS, max_attempts=JOB_MAX_ATTEMPTS,
+                 retry_delay_seconds=JOB_RETRY_DELAY_SECONDS, owner=None):
+        self.collection = collection
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.retry_delay_seconds = retry_delay_seconds
+        self._owner = owner
+        self._indexed = False
+
+    @property
+    def owner(self):
+        # Resolved on every use: the queue is created in the gunicorn master and used in forked workers
+        return self._owner or f"{socket.gethostname()}:{os.getpid()}"
+
+    def ensure_indexes(self):
+        if not self._indexed:
+            self.collection.create_index([("status", ASCENDING), ("available_at", ASCENDING)])
+            self.collection.create_index([("status", ASCENDING), ("lease_expires_at", ASCENDING)])
+            self._indexed = True
+
+    def enqueue(self, job_type, payload):
+        """Add a job and return its id."""
+        self.ensure_indexes()
+        now = utcnow()
+        return self.collection.insert_one({
+            "type": job_type,
+            "payload": payload,
+            "status": "queued",
+            "attempts": 0,
+            "created_at": now,
+            "available_at": now,
+            "lease_owner": None,
+            "lease_expires_at": None,
+            "error": None,
+        }).inserted_id
+
+    def claim(self, job_types=None, owner=None):
+        """Atomically take the oldest available job (queued, or running with an expired lease). Returns it or None."""
+        self.ensure_indexes()
+        now = utcnow()
+        query = {"$or": [
+            {"status": "queued", "available_at": {"$lte": now}},
+            {"status": "running", "lease_expires_at": {"$lt": now}, "attempts": {"$lt": self.max_attempts}},
+        ]}
+        if job_types:
+            query["type"] = {"$in": list(job_types)}
+        return self.collection.find_one_and_update(
+            query,
+            {
+                "$set": {"status": "running", "lease_owner": owner or self.owner,
+                         "lease_expires_at": now + timedelta(seconds=self.lease_seconds), "started_at": now},
+                "$inc": {"attempts": 1},
+            },
+            sort=[("available_at", ASCENDING)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    def _owned(self, job, owner=None):
+        return {"_id": job["_id"], "status": "running", "lease_owner": owner or self.owner, "attempts": job["attempts"]}
+
+    def heartbeat(self, job, owner=None):
+        """Extend the lease. Returns False when the lease was lost (expired and claimed elsewhere)."""
+        result = self.collection.update_one(
+            self._owned(job, owner), {"$set": {"lease_expires_at": utcnow() + timedelta(seconds=self.lease_seconds)}}
+        )
+        return result.matched_count == 1
+
+    def complete(self, job, owner=None):
+        result = self.collection.update_one(
+            self._owned(job, owner),
+            {"$set": {"status": "done", "finished_at": utcnow(), "lease_owner": None, "lease_expires_at": None}},
+        )
+        return result.matched_count == 1
+
+    def fail(self, job, error, owner=None):
+        """Record a failed attempt: queue it again after a delay, or mark it failed after the last attempt."""
+        if job["attempts"] < self.max_attempts:
+            update = {"status": "queued", "available_at": utcnow() + timedelta(seconds=self.retry_delay_seconds * job["attempts"])}
+        else:
+            update = {"status": "failed", "finished_at": utcnow()}
+        update.update({"error": error, "lease_owner": None, "lease_expires_at": None})
+        result = self.collection.update_one(self._owned(job, owner), {"$set": update})
+        return update["status"] if result.matched_count == 1 else None
+
+    def fail_expired(self):
+        """Mark jobs whose lease expired on their last attempt as failed. Returns the failed jobs."""
+        failed = []
+        while True:
+            job = self.collection.find_one_and_update(
+                {"status": "running", "lease_expires_at": {"$lt": utcnow()}, "attempts": {"$gte": self.max_attempts}},
+                {"$set": {"status": "failed", "finished_at": utcnow(), "error": "Lease expired on the last attempt",
+                          "lease_owner": None, "lease_expires_at": None}},
+                return_document=ReturnDocument.AFTER,
+            )
+            if job is None:
+                return failed
+            failed.append(job)
+
+    def stats(self):
+        return {status: self.collection.count_documents({"status": status}) for status in ("queued", "running", "done", "failed")}
+
+
+class JobWorker:
+    """
+    Threads that claim jobs from a JobQueue and run handlers[job type](**payload)
+    while a heartbeat keeps the lease alive. A handler exception fails the
+    attempt; on_failure[job type](payload, error) is called once a job has
+    failed for good, including jobs abandoned by a crashed worker.
+    """
+
+    def __init__(self, queue, handlers, on_failure=None, threads=JOB_WORKERS,
+                 poll_seconds=JOB_POLL_SECONDS, heartbeat_seconds=JOB_HEARTBEAT_SECONDS):
+        self.queue = queue
+        self.handlers = handlers
+        self.on_failure = on_failure or {}
+        self.threads = threads
+        self.poll_seconds = poll_seconds
+        self.heartbeat_seconds = heartbeat_seconds
+        self._stop = threading.Event()
+        self._threads = []
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def start(self, threads=None):
+        # Idempotent per process, so it can be called from a post-fork hook
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._stop.clear()
+            self._threads = []
+            for i in range(self.threads if threads is None else threads):
+                thread = threading.Thread(target=self._run, name=f"job-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self):
+        """Stop claiming new jobs; running jobs finish, abandoned leases are picked up elsewhere."""
+        self._stop.set()
+
+    def _failed(self, job, error):
+        callback = self.on_failure.get(job["type"])
+        if callback is not None:
+            try:
+                callback(job["payload"], error)
+            except Exception as e:
+                logging.error("Failure handler for job %s failed: %s", job["_id"], str(e))
+
+    def _heartbeat(self, job, done):
+        while not done.wait(self.heartbeat_seconds):
+            if not self.queue.heartbeat(job):
+                logging.warning("Lost the lease on job %s", job["_id"])
+                return
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                for job in self.queue.fail_expired():
+                    self._failed(job, job["error"])
+
+                job = self.queue.claim(list(self.handlers))
+            except Exception as e:
+                logging.error("Could not claim a job: %s", str(e))
+                job = None
+
+            if job is None:
+                self._stop.wait(self.poll_seconds)
+                continue
+
+            logging.info("Running job %s (%s), attempt %d", job["_id"], job["type"], job["attempts"])
+            done = threading.Event()
+            threading.Thread(target=self._heartbeat, args=(job, done), daemon=True).start()
+            try:
+                self.handlers[job["type"]](**job["payload"])
+                self.queue.complete(job)
+            except Exception as e:
+                logging.error("Job %s failed: %s", job["_id"], str(e))
+                if self.queue.fail(job, str(e)) == "failed":
+                    self._failed(job, str(e))
+            finally:
+                done.set()
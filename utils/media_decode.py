@@ -0,0 +1,191 @@
+import os
+import json
+import logging
+import threading
+import subprocess
+import numpy as np
+
+from utils.extract_audio import AUDIO_SAMPLE_RATE
+
+# Analysis resolution and rate for the decoded grayscale frames
+DEMUX_WIDTH = int(os.getenv("DEMUX_WIDTH", "480"))
+DEMUX_FPS = float(os.getenv("DEMUX_FPS", "5")) or None
+# Most frames kept in memory per recording (3000 grayscale 480x270 frames are about 390 MB)
+DEMUX_MAX_FRAMES = int(os.getenv("DEMUX_MAX_FRAMES", "3000"))
+
+
+def probe_media(video_path):
+    """Return width, height, fps, duration and whether the file has an audio track."""
+    command = [
+        'ffprobe', '-v', 'error', '-print_format', 'json',
+        '-show_streams', '-show_format', video_path
+    ]
+    result = subprocess.run(command, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    info = json.loads(result.stdout)
+
+    video = next((s for s in info.get('streams', []) if s.get('codec_type') == 'video'), None)
+    if video is None:
+        raise ValueError(f"No video stream in {video_path}")
+    has_audio = any(s.get('codec_type') == 'audio' for s in info.get('streams', []))
+
+    width, height = int(video['width']), int(video['height'])
+
+    # ffmpeg auto-rotates phone recordings, so swap the dimensions to match
+    rotation = int(video.get('tags', {}).get('rotate', 0))
+    for side_data in video.get('side_data_list', []):
+        rotation = int(side_data.get('rotation', rotation))
+    if abs(rotation) % 180 == 90:
+        width, height = height, width
+
+    num, den = video.get('avg_frame_rate', '0/1').split('/')
+    fps = float(num) / float(den) if float(den) else 0.0
+    duration = float(info.get('format', {}).get('duration') or video.get('duration') or 0)
+
+    return {"width": width, "height": height, "fps": fps or 30.0, "duration": duration, "has_audio": has_audio}
+
+
+class MediaDecoder:
+    """
+    Single ffmpeg pass over a recording that emits downscaled grayscale frames
+    on stdout and 16 kHz mono float32 PCM on a second pipe. Scaling, colour
+    conversion and resampling all happen inside ffmpeg. Frames are read into
+    one pre-allocated (n, height, width) array sized from the probed duration;
+    the frames are kept, because the facial stage consumes them after decoding
+    on its own executor. At most max_frames are held: long recordings (or a
+    native frame rate) are decoded at a lower rate that fits the cap, and any
+    frames past it are dropped. Recordings without an audio track get empty audio.
+    """
+
+    def __init__(self, video_path, width=DEMUX_WIDTH, fps=DEMUX_FPS, sample_rate=AUDIO_SAMPLE_RATE, max_frames=DEMUX_MAX_FRAMES):
+        self.video_path = video_path
+        self.sample_rate = sample_rate
+        self.max_frames = max(max_frames, 1)
+        self.info = probe_media(video_path)
+
+        # Output size keeps the aspect ratio with even dimensions, never upscaling
+        width = min(width or self.info["width"], self.info["width"])
+        self.width = width - width % 2
+        height = int(round(self.info["height"] * self.width / self.info["width"]))
+        self.height = height - height % 2
+        self.fps = fps or self.info["fps"]
+        # Lower the rate so the whole recording fits in max_frames
+        if self.info["duration"] * self.fps > self.max_frames:
+            self.fps = self.max_frames / self.info["duration"]
+        self.frame_bytes = self.width * self.height
+
+        self._process = None
+        self._audio_chunks = []
+        self._audio_thread = None
+
+    def _start(self):
+        filters = f"scale={self.width}:{self.height}"
+        if self.fps != self.info["fps"]:
+            filters = f"fps={self.fps}," + filters
+
+        command = [
+            'ffmpeg', '-nostdin', '-loglevel', 'error', '-i', self.video_path,
+            '-map', '0:v:0', '-vf', filters, '-pix_fmt', 'gray', '-f', 'rawvideo', 'pipe:1',
+        ]
+
+        # An audio output without an input stream makes ffmpeg fail, so video-only files get frames only
+        if not self.info["has_audio"]:
+            self._process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            return
+
+        audio_read, audio_write = os.pipe()
+        command += [
+            '-map', '0:a:0', '-vn', '-ac', '1', '-ar', str(self.sample_rate),
+            '-acodec', 'pcm_f32le', '-f', 'f32le', f'pipe:{audio_write}'
+        ]
+        self._process = subprocess.Popen(
+            command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, pass_fds=(audio_write,)
+        )
+        os.close(audio_write)
+
+        # Drain the audio pipe continuously so ffmpeg never blocks on it
+        self._audio_thread = threading.Thread(target=self._read_audio, args=(audio_read,), daemon=True)
+        self._audio_thread.start()
+
+    def _read_audio(self, fd):
+        with os.fdopen(fd, 'rb') as pipe:
+            for chunk in iter(lambda: pipe.read(1 << 16), b''):
+                self._audio_chunks.append(chunk)
+
+    def _read_frame_into(self, view):
+        # Fill one frame slot; returns False at end of stream
+        filled = 0
+        while filled < self.frame_bytes:
+            n = self._process.stdout.readinto(view[filled:])
+            if not n:
+                return False
+            filled += n
+        return True
+
+    def _finish(self, complete=True):
+        # Stopping early is not an error, ffmpeg is simply terminated
+        if not complete:
+            self._process.kill()
+        self._process.stdout.close()
+        stderr = self._process.stderr.read().decode(errors='ignore').strip()
+        returncode = self._process.wait()
+        if self._audio_thread is not None:
+            self._audio_thread.join()
+        if complete and returncode != 0:
+            raise RuntimeError(f"ffmpeg demux failed: {stderr}")
+
+    def audio(self):
+        """Decoded PCM samples (empty without an audio track), available once the frames have been consumed."""
+        if self._audio_thread is not None:
+            self._audio_thread.join()
+        return np.frombuffer(b''.join(self._audio_chunks), dtype=np.float32)
+
+    def decode(self):
+        """
+        Decode everything in one pass. Returns (frames, timestamps, audio)
+        where frames is a (n, height, width) uint8 array filled in place.
+        """
+        self._start()
+        capacity = min(int(self.info["duration"] * self.fps) + 16, self.max_frames)
+        frames = np.empty((max(capacity, 1), self.height, self.width), dtype=np.uint8)
+        count = dropped = 0
+        scratch = None
+        try:
+            while True:
+                if count == len(frames) < self.max_frames:
+                    # Duration under-reported by the container: grow by half, up to max_frames
+                    extra = min(len(frames) // 2 + 1, self.max_frames - len(frames))
+                    frames = np.concatenate([frames, np.empty((extra,) + frames.shape[1:], dtype=np.uint8)])
+                if count < len(frames):
+                    if not self._read_frame_into(memoryview(frames[count]).cast('B')):
+                        break
+                    count += 1
+                else:
+                    # Over the cap: keep reading into a scratch frame so ffmpeg finishes the audio
+                    if scratch is None:
+                        scratch = memoryview(bytearray(self.frame_bytes))
+                    if not self._read_frame_into(scratch):
+                        break
+                    dropped += 1
+        finally:
+            self._finish()
+
+        if dropped:
+            logging.warning("Dropped %d frames past DEMUX_MAX_FRAMES=%d in %s", dropped, self.max_frames, self.video_path)
+
+        timestamps = np.round(np.arange(count) / self.fps, 3)
+        return frames[:count], timestamps, self.audio()
+
+
+def decode_media(video_path, width=DEMUX_WIDTH, fps=DEMUX_FPS, sample_rate=AUDIO_SAMPLE_RATE, max_frames=DEMUX_MAX_FRAMES):
+    """
+    Demux a recording once into grayscale frames, their timestamps and PCM audio.
+    Returns a dictionary, or {"error": ...} like the other extraction helpers.
+    """
+    try:
+        decoder = MediaDecoder(video_path, width, fps, sample_rate, max_frames)
+        frames, timestamps, audio = decoder.decode()
+        return {"frames": frames, "timestamps": timestamps, "audio": audio, "fps": decoder.fps}
+    except subprocess.CalledProcessError as e:
+        return {"error": f"Media probe failed: {e.stderr.decode(errors='ignore').strip() or str(e)}"}
+    except Exception as e:
+        return {"error": f"Media decoding failed: {str(e)}"}
@@ -0,0 +1,115 @@
+import os
+import threading
+
+import numpy as np
+
+from utils.model_registry import registry
+from utils.model_server import ModelServerManager, MODEL_SERVER_SOCKET, client_authkey, share_array
+
+ModelServerManager.register("models")
+
+
+class ModelServerClient:
+    """
+    Connection to the model server. NumPy arguments are passed through
+    shared memory, everything else is pickled over the socket. The
+    connection is made lazily and again after a fork.
+    """
+
+    def __init__(self, socket_path=MODEL_SERVER_SOCKET, authkey=None):
+        self.socket_path = socket_path
+        self.authkey = authkey
+        self._service = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._service is None or self._pid != os.getpid():
+            with self._lock:
+                if self._service is None or self._pid != os.getpid():
+                    # The key is read on connect: the server may write its key file after this module is imported
+                    manager = ModelServerManager(address=self.socket_path, authkey=client_authkey(self.socket_path, self.authkey))
+                    manager.connect()
+                    self._service = manager.models()
+                    self._pid = os.getpid()
+        return self._service
+
+    def call(self, method, *args):
+        """Call a ModelService method, sharing non-empty array arguments for the duration of the call."""
+        segments = []
+        shared = []
+        try:
+            for arg in args:
+                if isinstance(arg, np.ndarray) and arg.nbytes:
+                    segment, arg = share_array(np.ascontiguousarray(arg))
+                    segments.append(segment)
+                shared.append(arg)
+            return getattr(self._connect(), method)(*shared)
+        finally:
+            for segment in segments:
+                segment.close()
+                segment.unlink()
+
+
+client = ModelServerClient()
+
+
+def options(**kwargs):
+    """Keyword arguments that were actually given, so the server keeps its own defaults for the rest."""
+    return {key: value for key, value in kwargs.items() if value is not None}
+
+
+def facial_emotion(video_path, frames=None, frame_timestamps=None, **kwargs):
+    """Same contract as src.facial_emotion.facial_emotion; video_path must be readable by the server."""
+    try:
+        # The server has its own working directory, so relative paths would not resolve there
+        video_path = os.path.abspath(video_path) if isinstance(video_path, str) else video_path
+        return client.call("facial_emotion", video_path, frames, frame_timestamps, options(**kwargs))
+    except Exception as e:
+        return {"error": f"Model server call failed: {str(e)}"}
+
+
+def speech_to_text(audio_file_path, sample_rate=16000, speech_map=None, model_id=None):
+    """Same contract as src.speech_to_text.speech_to_text: returns (text, error)."""
+    try:
+        return client.call("speech_to_text", audio_file_path, options(sample_rate=sample_rate, speech_map=speech_map, model_id=model_id))
+    except Exception as e:
+        return None, f"Model server call failed: {str(e)}"
+
+
+def compare(result, answers, question_id=None, model_id=None):
+    return client.call("compare", result, answers, options(question_id=question_id, model_id=model_id))
+
+
+def precompute_answer_embeddings(questions, batch_size=64, model_id=None):
+    return client.call("precompute_answer_embeddings", questions, options(batch_size=batch_size, model_id=model_id))
+
+
+def server_stats():
+    return client.call("stats")
+
+
+class RemoteSpeechEmotionRecognition:
+    """Stand-in for speechEmotionRecognition whose predictions run on the model server."""
+
+    def __init__(self):
+        self._emotion = client.call("speech_emotion_labels")
+
+    def predict_emotion_from_file(self, filename, **kwargs):
+        return client.call("speech_emotion", filename, kwargs)
+
+    def predict_emotion_from_array(self, y, **kwargs):
+        return client.call("speech_emotion", np.asarray(y, dtype=np.float32), kwargs)
+
+
+registry.register("speech_emotion", RemoteSpeechEmotionRecognition)
+
+
+def predict_speech_emotions(audio, speech_map=None):
+    """Same contract as src.speech_emotion1.predict_speech_emotions."""
+    SER = registry.get("speech_emotion")
+    if isinstance(audio, str):
+        emotions, _ = SER.predict_emotion_from_file(audio)
+    else:
+        emotions, _ = SER.predict_emotion_from_array(audio, speech_map=speech_map)
+    return emotions, list(SER._emotion.values())
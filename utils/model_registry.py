@@ -0,0 +1,144 @@
+import os
+import threading
+import logging
+from collections import OrderedDict
+
+# Memory budget for resident models in MB (0 disables eviction)
+DEFAULT_MEMORY_BUDGET_MB = int(os.getenv("MODEL_MEMORY_BUDGET_MB", "0"))
+
+
+def estimate_size_mb(model):
+    """Best-effort estimate of the memory held by a loaded model, in MB."""
+    if isinstance(model, (tuple, list)):
+        return sum(estimate_size_mb(item) for item in model)
+    if isinstance(model, dict):
+        return sum(estimate_size_mb(item) for item in model.values())
+
+    # PyTorch modules (Whisper, SentenceTransformer)
+    if hasattr(model, "parameters") and callable(model.parameters):
+        try:
+            return sum(p.numel() * p.element_size() for p in model.parameters()) / (1024 * 1024)
+        except Exception:
+            return 0
+
+    # Keras models (facial, speech emotion)
+    if hasattr(model, "count_params"):
+        try:
+            return model.count_params() * 4 / (1024 * 1024)
+        except Exception:
+            return 0
+
+    # Wrappers holding a model, e.g. the ASR pipeline or speechEmotionRecognition
+    for attr in ("model", "_model"):
+        inner = getattr(model, attr, None)
+        if inner is not None and inner is not model:
+            return estimate_size_mb(inner)
+
+    return 0
+
+
+class ModelRegistry:
+    """
+    Process-wide cache of loaded models shared by the analyzers in src/.
+    Models are registered with a loader and loaded lazily on first use (or
+    eagerly through preload). Resident models are kept under a memory budget
+    and the least recently used ones are evicted when it is exceeded.
+    """
+
+    def __init__(self, memory_budget_mb=DEFAULT_MEMORY_BUDGET_MB):
+        self.memory_budget_mb = memory_budget_mb
+        self._loaders = {}
+        self._size_hints = {}
+        self._models = OrderedDict()
+        self._sizes = {}
+        self._lock = threading.Lock()
+        self._load_locks = {}
+
+    def register(self, name, loader, size_mb=None):
+        """Register a loader for a model name. The loader takes no arguments."""
+        with self._lock:
+            self._loaders[name] = loader
+            self._size_hints[name] = size_mb
+            self._load_locks.setdefault(name, threading.Lock())
+
+    def is_registered(self, name):
+        return name in self._loaders
+
+    def get(self, name):
+        """Return the resident model for name, loading it if needed."""
+        with self._lock:
+            if name in self._models:
+                self._models.move_to_end(name)
+                return self._models[name]
+            if name not in self._loaders:
+                raise KeyError(f"No model registered under '{name}'")
+            load_lock = self._load_locks[name]
+
+        # Load outside the registry lock so other models stay available,
+        # but only once per name when several jobs ask at the same time
+        with load_lock:
+            with self._lock:
+                if name in self._models:
+                    self._models.move_to_end(name)
+                    return self._models[name]
+                loader = self._loaders[name]
+
+            logging.info("Loading model '%s'", name)
+            model = loader()
+            size_mb = self._size_hints.get(name) or estimate_size_mb(model)
+
+            with self._lock:
+                self._models[name] = model
+                self._sizes[name] = size_mb
+                self._evict_over_budget(keep=name)
+            logging.info("Model '%s' resident (%.1f MB)", name, size_mb)
+            return model
+
+    def preload(self, names=None):
+        """Eagerly load the given models (all registered models by default)."""
+        for name in names or list(self._loaders):
+            try:
+                self.get(name)
+            except Exception as e:
+                logging.error("Failed to preload model '%s': %s", name, str(e))
+
+    def evict(self, name):
+        """Drop a resident model so it is reloaded on next use."""
+        with self._lock:
+            self._models.pop(name, None)
+            self._sizes.pop(name, None)
+
+    def clear(self):
+        with self._lock:
+            self._models.clear()
+            self._sizes.clear()
+
+    def resident_mb(self):
+        with self._lock:
+            return sum(self._sizes.values())
+
+    def stats(self):
+        """Snapshot of resident models, their sizes and the budget."""
+        with self._lock:
+            return {
+                "memory_budget_mb": self.memory_budget_mb,
+                "resident_mb": round(sum(self._sizes.values()), 1),
+                "models": {name: round(self._sizes[name], 1) for name in self._models},
+                "registered": list(self._loaders),
+            }
+
+    def _evict_over_budget(self, keep=None):
+        # Called with the registry lock held
+        if not self.memory_budget_mb:
+            return
+        while sum(self._sizes.values()) > self.memory_budget_mb:
+            victim = next((name for name in self._models if name != keep), None)
+            if victim is None:
+                break
+            logging.info("Evicting model '%s' to stay under %s MB", victim, self.memory_budget_mb)
+            self._models.pop(victim)
+            self._sizes.pop(victim)
+
+
+# Shared registry used by all analyzers in this process
+registry = ModelRegistry()
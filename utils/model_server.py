@@ -0,0 +1,172 @@
+import os
+import logging
+import secrets
+from multiprocessing import shared_memory, resource_tracker
+from multiprocessing.managers import BaseManager
+
+import numpy as np
+
+# Unix socket of the model server; when set, web workers send model calls there instead of loading models
+MODEL_SERVER_SOCKET = os.getenv("MODEL_SERVER_SOCKET")
+# Shared secret of the socket. Without it the server generates one and writes it to <socket>.key (mode 0600)
+MODEL_SERVER_AUTHKEY = os.getenv("MODEL_SERVER_AUTHKEY")
+
+
+def authkey_path(socket_path):
+    return f"{socket_path}.key"
+
+
+def server_authkey(socket_path, authkey=None):
+    """The configured key, or a fresh random one saved next to the socket for clients run by the same user."""
+    authkey = authkey or os.getenv("MODEL_SERVER_AUTHKEY")
+    if authkey:
+        return authkey.encode() if isinstance(authkey, str) else authkey
+
+    authkey = secrets.token_hex(32)
+    path = authkey_path(socket_path)
+    if os.path.exists(path):
+        os.remove(path)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, "w") as f:
+        f.write(authkey)
+    return authkey.encode()
+
+
+def client_authkey(socket_path, authkey=None):
+    """The configured key, or the one the server wrote next to the socket."""
+    authkey = authkey or os.getenv("MODEL_SERVER_AUTHKEY")
+    if authkey:
+        return authkey.encode() if isinstance(authkey, str) else authkey
+
+    path = authkey_path(socket_path)
+    if not os.path.exists(path):
+        raise RuntimeError(f"No model server key: set MODEL_SERVER_AUTHKEY or start model_server.py to create {path}")
+    with open(path) as f:
+        return f.read().strip().encode()
+
+
+class SharedArray:
+    """Descriptor of a NumPy array placed in a shared memory segment."""
+
+    def __init__(self, name, shape, dtype):
+        self.name = name
+        self.shape = shape
+        self.dtype = dtype
+
+
+def share_array(array):
+    """Copy array into a new shared memory segment. Returns (segment, descriptor); the caller unlinks the segment."""
+    segment = shared_memory.SharedMemory(create=True, size=array.nbytes)
+    np.ndarray(array.shape, dtype=array.dtype, buffer=segment.buf)[...] = array
+    return segment, SharedArray(segment.name, array.shape, array.dtype.str)
+
+
+def resolve_array(value, untrack=True):
+    """
+    Copy a SharedArray out of its segment; other values are returned unchanged.
+    Pass untrack=False in processes that share the creator's resource tracker
+    (spawned pool children): the creator's unlink unregisters the segment there.
+    """
+    if not isinstance(value, SharedArray):
+        return value
+    segment = shared_memory.SharedMemory(name=value.name)
+    if untrack:
+        try:
+            # Attaching registers the segment with this process's resource tracker, which would unlink it at exit
+            resource_tracker.unregister(segment._name, "shared_memory")
+        except Exception:
+            pass
+    view = np.ndarray(value.shape, dtype=np.dtype(value.dtype), buffer=segment.buf)
+    array = view.copy()
+    del view
+    segment.close()
+    return array
+
+
+class ModelService:
+    """
+    Model calls served by the daemon. Each method runs the regular analyzer
+    from src/ against the models resident in this process.
+    """
+
+    def __init__(self):
+        from utils.cpu_budget import CPU_BUDGET_ENABLED, configure_runtimes, plan_budget, runtime_threads
+
+        # All analyzers share this process, size the runtime pools before any model loads
+        if CPU_BUDGET_ENABLED:
+            plan = plan_budget()
+            configure_runtimes(**runtime_threads(plan, plan))
+
+        # Importing the analyzers registers their models
+        from src.compare import answer_cache
+        import src.facial_emotion
+        import src.speech_emotion1
+        import src.speech_to_text
+        from utils.database.connection import mongo
+
+        answer_cache.attach(mongo.collection("questions"))
+
+    def facial_emotion(self, video_path, frames=None, frame_timestamps=None, options=None):
+        from src.facial_emotion import facial_emotion
+        return facial_emotion(video_path, frames=resolve_array(frames), frame_timestamps=resolve_array(frame_timestamps), **(options or {}))
+
+    def speech_emotion(self, audio, options=None):
+        from utils.model_registry import registry
+        SER = registry.get("speech_emotion")
+        audio = resolve_array(audio)
+        if isinstance(audio, str):
+            emotions, timestamps = SER.predict_emotion_from_file(audio, **(options or {}))
+        else:
+            emotions, timestamps = SER.predict_emotion_from_array(audio, **(options or {}))
+        return emotions, np.asarray(timestamps).tolist()
+
+    def speech_emotion_labels(self):
+        from src.speech_emotion1 import speechEmotionRecognition
+        return speechEmotionRecognition()._emotion
+
+    def speech_to_text(self, audio, options=None):
+        from src.speech_to_text import speech_to_text
+        return speech_to_text(resolve_array(audio), **(options or {}))
+
+    def compare(self, result, answers, options=None):
+        from src.compare import compare
+        return float(compare(result, answers, **(options or {})))
+
+    def precompute_answer_embeddings(self, questions, options=None):
+        from src.compare import precompute_answer_embeddings
+        return precompute_answer_embeddings(questions, **(options or {}))
+
+    def preload(self, names=None):
+        from utils.model_registry import registry
+        registry.preload(names)
+
+    def stats(self):
+        from utils.model_registry import registry
+        from utils.inference_broker import broker
+        return {"pid": os.getpid(), "models": registry.stats(), "broker": broker.stats()}
+
+
+class ModelServerManager(BaseManager):
+    pass
+
+
+def serve(socket_path=MODEL_SERVER_SOCKET, authkey=None, preload=False):
+    """
+    Run the model server on a Unix socket until interrupted. Every client connection gets its own thread.
+    Clients are unpickled, so the socket never runs without a secret key (see server_authkey).
+    """
+    if not socket_path:
+        raise ValueError("No socket path given, set MODEL_SERVER_SOCKET")
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+
+    authkey = server_authkey(socket_path, authkey)
+
+    service = ModelService()
+    if preload:
+        service.preload()
+
+    ModelServerManager.register("models", callable=lambda: service)
+    server = ModelServerManager(address=socket_path, authkey=authkey).get_server()
+    logging.info("Model server listening on %s", socket_path)
+    server.serve_forever()
@@ -0,0 +1,108 @@
+import os
+import logging
+import importlib
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+from utils.executor import stage_config_from_env
+from utils.model_server import MODEL_SERVER_SOCKET, share_array, resolve_array
+from utils.cpu_budget import CPU_BUDGET_ENABLED, configure_stage_process
+
+# Run the CPU-bound analyzers in worker processes ("process") or on the stage threads ("thread")
+STAGE_EXECUTION = os.getenv("STAGE_EXECUTION", "thread").lower()
+
+# Module registering each pooled stage's model, and the model every pool process loads at start
+STAGE_MODELS = {
+    "facial": ("src.facial_emotion", "facial"),
+    "speech_emotion": ("src.speech_emotion1", "speech_emotion"),
+    "transcript": ("src.speech_to_text", "whisper"),
+}
+
+
+def _init_stage_process(stage, module, model):
+    # Runs once in every pool process: apply the stage's CPU budget, then register and load its model
+    if CPU_BUDGET_ENABLED:
+        configure_stage_process(stage)
+    importlib.import_module(module)
+    from utils.model_registry import registry
+    registry.preload([model])
+
+
+def _call_shared(fn, args, kwargs):
+    # Pool processes share the parent's resource tracker and the parent unlinks the segments, so leave them tracked
+    args = [resolve_array(arg, untrack=False) for arg in args]
+    kwargs = {key: resolve_array(value, untrack=False) for key, value in kwargs.items()}
+    return fn(*args, **kwargs)
+
+
+class StagePools:
+    """
+    One spawn-context process pool per CPU-bound stage, sized like the
+    stage's executor workers. The stage threads stay the orchestrators:
+    they hand the compute function to the pool, wait for its result and
+    write it to Mongo themselves. Array arguments go through shared memory.
+    """
+
+    def __init__(self, mode=STAGE_EXECUTION, config=None):
+        # A model server already keeps the models out of this process
+        self.mode = "thread" if MODEL_SERVER_SOCKET else mode
+        self.config = config or stage_config_from_env()
+        self._pools = {}
+        self._lock = threading.Lock()
+
+    def enabled(self, stage):
+        return self.mode == "process" and stage in STAGE_MODELS
+
+    def _pool(self, stage):
+        with self._lock:
+            if stage not in self._pools:
+                self._pools[stage] = ProcessPoolExecutor(
+                    max_workers=self.config[stage][0], mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_stage_process, initargs=(stage,) + STAGE_MODELS[stage]
+                )
+            return self._pools[stage]
+
+    def run(self, stage, fn, *args, **kwargs):
+        """Call fn(*args, **kwargs) in the stage's pool and return its result (inline in thread mode)."""
+        if not self.enabled(stage):
+            return fn(*args, **kwargs)
+
+        segments = []
+
+        def share(value):
+            if isinstance(value, np.ndarray) and value.nbytes:
+                segment, value = share_array(np.ascontiguousarray(value))
+                segments.append(segment)
+            return value
+
+        try:
+            shared_args = [share(arg) for arg in args]
+            shared_kwargs = {key: share(value) for key, value in kwargs.items()}
+            pool = self._pool(stage)
+            try:
+                return pool.submit(_call_shared, fn, shared_args, shared_kwargs).result()
+            except BrokenProcessPool:
+                # A crashed process (e.g. out of memory) breaks the whole pool, start a fresh one next time
+                logging.error("Process pool for stage '%s' is broken, recreating it", stage)
+                with self._lock:
+                    if self._pools.get(stage) is pool:
+                        del self._pools[stage]
+                raise
+        finally:
+            for segment in segments:
+                segment.close()
+                segment.unlink()
+
+    def shutdown(self):
+        with self._lock:
+            pools, self._pools = self._pools, {}
+        for pool in pools.values():
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+# Shared pools for the analysis stages of this process
+stage_pools = StagePools()
@@ -0,0 +1,41 @@
+import os
+
+# Model variants per tier, trading accuracy for latency
+TIERS = {
+    "fast": {
+        "whisper": "distil-whisper/distil-small.en",
+        "sentence": "sentence-transformers/all-MiniLM-L6-v2",
+        # Sampled facial pass: 2 analysed frames per second, faces re-detected every 5th one
+        "facial": {"sample_fps": 2, "detect_every": 5},
+    },
+    "balanced": {
+        "whisper": "distil-whisper/distil-medium.en",
+        "sentence": "sentence-transformers/all-MiniLM-L12-v2",
+        "facial": {"sample_fps": 5, "detect_every": 3},
+    },
+    "accurate": {
+        "whisper": "distil-whisper/distil-large-v3",
+        "sentence": "sentence-transformers/all-MiniLM-L12-v2",
+        # Full facial pass with the FACIAL_* settings
+        "facial": {},
+    },
+}
+
+# Tier used when a request does not pick one
+DEFAULT_TIER = os.getenv("DEFAULT_TIER", "accurate").lower()
+
+
+def resolve_tier(tier=None):
+    """Return the normalised tier name, or raise ValueError for an unknown tier."""
+    tier = tier or DEFAULT_TIER
+    # Request bodies are JSON, so the tier may arrive as a number, list or object
+    if not isinstance(tier, str):
+        raise ValueError(f"Tier must be a string, expected one of {', '.join(TIERS)}")
+    tier = tier.lower()
+    if tier not in TIERS:
+        raise ValueError(f"Unknown tier '{tier}', expected one of {', '.join(TIERS)}")
+    return tier
+
+
+def tier_settings(tier=None):
+    return TIERS[resolve_tier(tier)]
@@ -0,0 +1,132 @@
+import os
+import numpy as np
+
+# Energy-based voice activity detection, computed once per job
+VAD_ENABLED = os.getenv("VAD_ENABLED", "false").lower() == "true"
+# Speech must be this many dB above the estimated noise floor ...
+VAD_MARGIN_DB = float(os.getenv("VAD_MARGIN_DB", "12"))
+# ... and above this absolute level (dBFS). A recording with no frame above it has no speech at all
+VAD_MIN_LEVEL_DB = float(os.getenv("VAD_MIN_LEVEL_DB", "-60"))
+# Highest plausible noise floor (dBFS): above it the recording has no pauses to measure noise in
+VAD_MAX_NOISE_DB = float(os.getenv("VAD_MAX_NOISE_DB", "-50"))
+# Minimum share of speech for a speech-emotion chunk to be analysed
+VAD_MIN_CHUNK_SPEECH = float(os.getenv("VAD_MIN_CHUNK_SPEECH", "0.3"))
+
+
+class SpeechMap:
+    """Speech segments of one recording, as (start, end) sample indices."""
+
+    def __init__(self, segments, n_samples, sample_rate=16000, fallback=False):
+        self.segments = segments
+        self.n_samples = n_samples
+        self.sample_rate = sample_rate
+        # True when speech could not be told apart from noise and the whole recording is kept
+        self.fallback = fallback
+        self._bounds = np.asarray(segments, dtype=np.int64).reshape(-1, 2)
+
+    @property
+    def has_speech(self):
+        return len(self.segments) > 0
+
+    @property
+    def speech_seconds(self):
+        return round(sum(end - start for start, end in self.segments) / self.sample_rate, 2)
+
+    def chunk_ratios(self, starts, size):
+        """Voiced share of each [start, start + size) window (segments never overlap)."""
+        starts = np.asarray(starts, dtype=np.int64)[:, np.newaxis]
+        ends = starts + size
+        overlap = np.minimum(ends, self._bounds[:, 1]) - np.maximum(starts, self._bounds[:, 0])
+        return np.clip(overlap, 0, None).sum(axis=1) / size
+
+    def speech_ratio(self, start, end):
+        """Share of samples in [start, end) that are voiced."""
+        if end <= start:
+            return 0.0
+        return float(self.chunk_ratios([start], end - start)[0])
+
+    def voiced_audio(self, audio, gap_s=0.2):
+        """Voiced regions only, joined with short silences so the decoder still sees pauses."""
+        if not self.segments:
+            return np.zeros(0, dtype=np.float32)
+        gap = np.zeros(int(gap_s * self.sample_rate), dtype=np.float32)
+        pieces = []
+        for start, end in self.segments:
+            pieces.extend([np.asarray(audio[start:end], dtype=np.float32), gap])
+        return np.concatenate(pieces[:-1])
+
+    def to_dict(self):
+        return {
+            "segments": [[round(start / self.sample_rate, 2), round(end / self.sample_rate, 2)] for start, end in self.segments],
+            "speechSeconds": self.speech_seconds,
+            "fallback": self.fallback,
+        }
+
+
+def detect_speech(audio, sample_rate=16000, frame_ms=30, margin_db=VAD_MARGIN_DB, min_level_db=VAD_MIN_LEVEL_DB,
+                  max_noise_db=VAD_MAX_NOISE_DB, min_speech_ms=250, hangover_ms=300, pad_ms=200):
+    """
+    Build a SpeechMap from frame energies. A frame is voiced when its level is
+    margin_db above the noise floor (10th percentile of frame levels) and
+    above min_level_db. Voiced runs are bridged across pauses shorter than
+    hangover_ms, runs shorter than min_speech_ms are dropped and the rest are
+    padded by pad_ms on both sides.
+
+    Only a recording with no frame above min_level_db gets an empty map (no
+    speech). When the noise floor is above max_noise_db (no pauses, so the
+    quietest frames are speech) or nothing clears the relative threshold
+    (a quiet answer), the whole recording is kept as speech (fallback=True)
+    so the models still run on it.
+    """
+    audio = np.asarray(audio, dtype=np.float32)
+    frame = int(sample_rate * frame_ms / 1000)
+    n_frames = len(audio) // frame
+    if n_frames == 0:
+        return SpeechMap([], len(audio), sample_rate)
+
+    frames = audio[:n_frames * frame].reshape(n_frames, frame)
+    level_db = 10 * np.log10(np.mean(frames ** 2, axis=1) + 1e-12)
+
+    # Silence or a faint hum only
+    if not np.any(level_db > min_level_db):
+        return SpeechMap([], len(audio), sample_rate)
+
+    whole = SpeechMap([(0, len(audio))], len(audio), sample_rate, fallback=True)
+    noise_floor = np.percentile(level_db, 10)
+    if noise_floor > max_noise_db:
+        return whole
+
+    threshold = max(noise_floor + margin_db, min_level_db)
+    voiced = level_db > threshold
+
+    # Runs of voiced frames as [start, end) frame indices
+    edges = np.diff(np.concatenate([[0], voiced.astype(np.int8), [0]]))
+    runs = list(zip(np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)))
+
+    # Bridge short pauses
+    hangover = int(hangover_ms / frame_ms)
+    merged = []
+    for start, end in runs:
+        if merged and start - merged[-1][1] <= hangover:
+            merged[-1][1] = end
+        else:
+            merged.append([start, end])
+
+    # Drop blips, pad and convert to samples
+    min_frames = int(min_speech_ms / frame_ms)
+    pad = int(sample_rate * pad_ms / 1000)
+    segments = []
+    for start, end in merged:
+        if end - start < min_frames:
+            continue
+        start, end = max(0, start * frame - pad), min(len(audio), end * frame + pad)
+        if segments and start <= segments[-1][1]:
+            segments[-1] = (segments[-1][0], int(end))
+        else:
+            segments.append((int(start), int(end)))
+
+    # Audible but below the relative threshold: never drop the answer on an energy guess
+    if not segments:
+        return whole
+
+    return SpeechMap(segments, len(audio), sample_rate)